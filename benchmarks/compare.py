@@ -0,0 +1,53 @@
+"""
+Compares two result files written by benchmarks/run.py.
+
+    python benchmarks/compare.py before.json after.json
+"""
+import sys
+import json
+import argparse
+
+METRICS = [
+    ("lines_per_sec", "lines/s", True),
+    ("wall_time_s", "wall s", False),
+    ("requests_per_file", "req/file", False),
+    ("prompt_bytes", "prompt bytes", False),
+    ("peak_rss_kb", "peak RSS KB", False),
+]
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    # Average repetitions of the same scenario.
+    grouped = {}
+    for result in report["results"]:
+        grouped.setdefault(result["scenario"], []).append(result)
+    averaged = {}
+    for scenario, runs in grouped.items():
+        averaged[scenario] = {key: sum(run[key] for run in runs) / len(runs) for key, _, _ in METRICS}
+    return report.get("revision"), averaged
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two ThutorPy benchmark result files.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    before_revision, before = load(args.before)
+    after_revision, after = load(args.after)
+    print(f"before: {before_revision}  after: {after_revision}\n")
+    print(f"{'scenario':<28}{'metric':<14}{'before':>14}{'after':>14}{'change':>10}")
+    for scenario in sorted(set(before) & set(after)):
+        for key, label, higher_is_better in METRICS:
+            old, new = before[scenario][key], after[scenario][key]
+            change = (new - old) / old * 100 if old else 0.0
+            better = (change > 0) == higher_is_better and change != 0
+            marker = "+" if better else ("-" if change else " ")
+            print(f"{scenario:<28}{label:<14}{old:>14.2f}{new:>14.2f}{change:>9.1f}%{marker}")
+
+    missing = set(before) ^ set(after)
+    if missing:
+        print(f"\nOnly in one file: {', '.join(sorted(missing))}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
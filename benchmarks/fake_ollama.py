@@ -0,0 +1,177 @@
+"""
+A deterministic stand-in for Ollama's /api/generate endpoint.
+
+Each response is derived from a hash of the prompt, so two runs over the
+same input produce the same comments. Latency, decode speed and the share
+of failed requests are configurable, and the server counts the requests
+and prompt bytes it receives so benchmarks can report them.
+
+Run it on its own with:
+
+    python benchmarks/fake_ollama.py --port 11434 --latency 0.05 --tokens-per-sec 200
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LISTING_PATTERN = re.compile(r"^(\d+): ", re.MULTILINE)
+LISTING_MARKER = "Lines to comment (line number: code):"
+
+class FakeOllamaServer:
+    """
+    Serves /api/generate on a background thread.
+
+    `latency` is a fixed delay per request in seconds, `tokens_per_sec`
+    adds decode time in proportion to the length of the answer (0 disables
+    it), and `error_rate` is the probability of answering with HTTP 503.
+    Failures come from a seeded random generator, so they are reproducible.
+    With `models`, requests for any other model get a 404, as from Ollama.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, tokens_per_sec=0.0, error_rate=0.0, seed=0, models=None):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.models = models
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this, Nagle's
+            # algorithm and delayed ACKs add ~40ms to every keep-alive request.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, payload = server.handle(body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                payload = json.dumps(server.stats()).encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/api/generate"
+        self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.prompt_bytes = 0
+            self.inflight = 0
+            self.max_inflight = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "prompt_bytes": self.prompt_bytes,
+                "max_inflight": self.max_inflight,
+            }
+
+    def handle(self, body):
+        request = json.loads(body)
+        prompt = request.get("prompt", "")
+        if self.models is not None and request.get("model") not in self.models:
+            with self._lock:
+                self.requests += 1
+            return 404, json.dumps({"error": f"model '{request.get('model')}' not found"}).encode('utf-8')
+        with self._lock:
+            self.requests += 1
+            self.prompt_bytes += len(prompt.encode('utf-8'))
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+
+        try:
+            if fail:
+                time.sleep(self.latency)
+                return 503, json.dumps({"error": "simulated failure"}).encode('utf-8')
+
+            answer = self.answer(prompt, request.get("format") == "json")
+            eval_count = max(1, len(answer) // 4)
+            prompt_eval_count = max(1, len(prompt) // 4)
+            decode = eval_count / self.tokens_per_sec if self.tokens_per_sec else 0.0
+            time.sleep(self.latency + decode)
+            nanoseconds = int((self.latency + decode) * 1e9)
+            return 200, json.dumps({
+                "model": request.get("model", ""),
+                "response": answer,
+                "done": True,
+                "prompt_eval_count": prompt_eval_count,
+                "eval_count": eval_count,
+                "total_duration": nanoseconds,
+                "load_duration": 0,
+                "prompt_eval_duration": int(self.latency * 1e9),
+                "eval_duration": int(decode * 1e9),
+            }).encode('utf-8')
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def answer(self, prompt, json_format):
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+        if not json_format:
+            return f"Explains this line ({digest})."
+        listing = prompt.split(LISTING_MARKER, 1)[-1]
+        numbers = LISTING_PATTERN.findall(listing)
+        return json.dumps({number: f"Explains line {number} ({digest})." for number in numbers})
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a deterministic fake Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fixed delay per request in seconds.")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="Simulated decode speed; 0 disables it.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of answering with HTTP 503.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, args.latency, args.tokens_per_sec, args.error_rate, args.seed)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmarks core.analyze_code and main.process_repository against a fake
+Ollama server and writes the results as JSON.
+
+Each scenario runs in a fresh child process, so its peak RSS is its own.
+Compare two result files with benchmarks/compare.py.
+
+    python benchmarks/run.py --workers 8 --output before.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import datetime
+import contextlib
+import subprocess
+import multiprocessing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import synthetic
+from fake_ollama import FakeOllamaServer
+
+# name: (files, lines per file)
+SIZES = {
+    "small": (5, 80),
+    "medium": (20, 200),
+    "large": (60, 400),
+}
+
+def peak_rss_kb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def run_scenario(kind, source, output_dir, config, engine_options, results):
+    """Child process body: runs one scenario and reports wall time and peak RSS."""
+    from thutorpy import core, main as thutorpy_main
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        with core.AnalysisEngine(config, **engine_options) as engine:
+            if kind == "analyze_code":
+                core.analyze_code(source, os.path.join(output_dir, os.path.basename(source)), config, engine)
+            else:
+                thutorpy_main.process_repository(source, output_dir, config, engine)
+        wall_time = time.perf_counter() - started
+    results.put({"wall_time_s": wall_time, "peak_rss_kb": peak_rss_kb()})
+
+def benchmark(kind, size, workdir, server, args, context):
+    files, lines_per_file = SIZES[size]
+    source_dir = os.path.join(workdir, f"{kind}_{size}")
+    if kind == "analyze_code":
+        files = 1
+        source = synthetic.write_file(os.path.join(source_dir, "module.py"), files * lines_per_file * 4)
+    else:
+        source = synthetic.write_repository(source_dir, files, lines_per_file)
+    lines = synthetic.count_commentable_lines(source_dir)
+
+    output_dir = os.path.join(workdir, f"out_{kind}_{size}")
+    os.makedirs(output_dir, exist_ok=True)
+    config = {
+        "OLLAMA_API_URL": server.url,
+        "OLLAMA_MODEL": "benchmark",
+        "THUTORPY_OUTPUT_DIR": workdir,
+        "OLLAMA_MAX_RETRIES": args.retries,
+    }
+    engine_options = {
+        "workers": args.workers,
+        "batch_lines": args.batch_lines,
+        "use_cache": args.cache,
+        "context_tokens": args.context_tokens,
+    }
+
+    runs = []
+    for repetition in range(args.repeat):
+        server.reset()
+        results = context.Queue()
+        child = context.Process(
+            target=run_scenario,
+            args=(kind, source, output_dir, config, engine_options, results)
+        )
+        child.start()
+        measured = results.get()
+        child.join()
+        stats = server.stats()
+        runs.append({
+            "scenario": f"{kind}/{size}",
+            "repetition": repetition,
+            "files": files,
+            "lines": lines,
+            "wall_time_s": round(measured["wall_time_s"], 4),
+            "lines_per_sec": round(lines / measured["wall_time_s"], 2),
+            "requests": stats["requests"],
+            "requests_per_file": round(stats["requests"] / files, 2),
+            "prompt_bytes": stats["prompt_bytes"],
+            "server_errors": stats["errors"],
+            "max_inflight": stats["max_inflight"],
+            "peak_rss_kb": measured["peak_rss_kb"],
+        })
+        print(f"{kind}/{size} #{repetition}: {runs[-1]['lines_per_sec']} lines/s, "
+              f"{stats['requests']} requests, {stats['prompt_bytes']} prompt bytes", file=sys.stderr)
+    return runs
+
+def git_revision():
+    result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ThutorPy against a fake Ollama server.")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=sorted(SIZES))
+    parser.add_argument("--scenarios", nargs="+", default=["analyze_code", "process_repository"],
+                        choices=["analyze_code", "process_repository"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-lines", type=int, default=1)
+    parser.add_argument("--context-tokens", type=int, default=None)
+    parser.add_argument("--cache", action="store_true", help="Use the comment cache (repeat runs hit it).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario.")
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.005, help="Fake server delay per request in seconds.")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="Fake server decode speed; 0 disables it.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Where to write the JSON results (default: stdout).")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir, \
+            FakeOllamaServer(latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+                             error_rate=args.error_rate, seed=args.seed) as server:
+        for kind in args.scenarios:
+            for size in args.sizes:
+                results.extend(benchmark(kind, size, workdir, server, args, context))
+
+    report = {
+        "revision": git_revision(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Deterministic synthetic source trees for benchmarks.
+
+The generated Python modules mix imports, classes, methods, blank lines
+and comments, so context selection, batching and caching all see
+realistic input. The same arguments always produce the same files.
+"""
+import os
+import random
+
+def generate_module(lines, seed):
+    rng = random.Random(seed)
+    out = [
+        "import os",
+        "import sys",
+        "import json",
+        "from collections import defaultdict",
+        "",
+    ]
+    class_index = 0
+    while len(out) < lines:
+        class_index += 1
+        out.append(f"class Worker{seed}_{class_index}:")
+        out.append(f'    """Processes batch {class_index} of module {seed}."""')
+        out.append("")
+        out.append("    def __init__(self, name, size):")
+        out.append("        self.name = name")
+        out.append("        self.size = size")
+        out.append("        self.items = defaultdict(list)")
+        out.append("")
+        for method in range(rng.randint(2, 5)):
+            out.append(f"    def step_{method}(self, value):")
+            out.append(f"        # Step {method} of the pipeline")
+            for statement in range(rng.randint(3, 10)):
+                choice = rng.randint(0, 4)
+                if choice == 0:
+                    out.append(f"        value = value * {rng.randint(2, 9)} + {statement}")
+                elif choice == 1:
+                    out.append(f"        if value > {rng.randint(10, 999)}:")
+                    out.append(f"            self.items[self.name].append(value)")
+                elif choice == 2:
+                    out.append(f"        for index in range(self.size):")
+                    out.append(f"            value += index % {rng.randint(2, 7)}")
+                elif choice == 3:
+                    out.append(f"        path = os.path.join(self.name, str(value))")
+                else:
+                    out.append(f"        print(json.dumps({{'step': {method}, 'value': value}}), file=sys.stderr)")
+            out.append("        return value")
+            out.append("")
+    return "\n".join(out[:lines]) + "\n"
+
+def write_file(path, lines, seed=0):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(generate_module(lines, seed))
+    return path
+
+def write_repository(root, files, lines_per_file, seed=0):
+    """Writes `files` modules of `lines_per_file` lines, spread over a few packages."""
+    for index in range(files):
+        package = f"package_{index % 4}"
+        write_file(os.path.join(root, package, f"module_{index}.py"), lines_per_file, seed + index)
+    return root
+
+def count_commentable_lines(root):
+    """Counts the non-blank lines of every file under root."""
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            with open(os.path.join(dirpath, filename), 'r', encoding='utf-8') as f:
+                total += sum(1 for line in f if line.strip())
+    return total
@@ -0,0 +1,112 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_FILENAME = ".thutorpy_cache.sqlite3"
+DEFAULT_MAX_SIZE_MB = 256
+# The size limit is enforced after this many writes, and when the cache is closed.
+PRUNE_EVERY = 1000
+
+def default_cache_path(config):
+    """Returns the cache location inside the configured output directory."""
+    return os.path.join(config["THUTORPY_OUTPUT_DIR"], CACHE_FILENAME)
+
+def make_key(model, prompt_version, code_line, context):
+    """
+    Builds a content-addressed key from everything that determines a comment:
+    the model, the prompt version, the line itself and the context sent with it.
+    """
+    context_hash = hashlib.sha256(context.encode('utf-8')).hexdigest()
+    material = "\0".join([model, str(prompt_version), code_line, context_hash])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class CommentCache:
+    """
+    On-disk comment cache backed by SQLite, with size-based LRU eviction.
+    A single connection is shared between threads behind a lock.
+    """
+    def __init__(self, path, max_size_mb=DEFAULT_MAX_SIZE_MB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS comments ("
+            " key TEXT PRIMARY KEY,"
+            " comment TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS comments_last_access ON comments (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT comment FROM comments WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE comments SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, comment):
+        size = len(key) + len(comment.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO comments (key, comment, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, comment, size, time.time())
+            )
+            self._conn.commit()
+            self._puts += 1
+            due = self._puts % PRUNE_EVERY == 0
+        if due:
+            self.prune()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM comments").fetchone()
+        return {
+            "path": self.path,
+            "entries": entries,
+            "size_bytes": total,
+            "max_size_bytes": self.max_bytes,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+    def prune(self, max_bytes=None):
+        """Evicts least recently used entries until the cache fits in max_bytes. Returns the number removed."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        removed = 0
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM comments").fetchone()[0]
+            if total <= limit:
+                return 0
+            rows = self._conn.execute("SELECT key, size FROM comments ORDER BY last_access ASC")
+            stale = []
+            for key, size in rows:
+                if total <= limit:
+                    break
+                stale.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM comments WHERE key = ?", stale)
+            self._conn.commit()
+            removed = len(stale)
+            if limit == 0:
+                self._conn.execute("VACUUM")
+        return removed
+
+    def close(self):
+        self.prune()
+        with self._lock:
+            self._conn.close()
+
+def open_cache(config):
+    """Opens the comment cache configured for this run."""
+    max_size_mb = config.get("THUTORPY_CACHE_MAX_MB", DEFAULT_MAX_SIZE_MB)
+    path = config.get("THUTORPY_CACHE_PATH") or default_cache_path(config)
+    return CommentCache(path, max_size_mb)
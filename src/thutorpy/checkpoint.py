@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import threading
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Progress is written to disk at most this often, and always when a file finishes.
+CHECKPOINT_INTERVAL = 2.0
+
+class ManifestError(Exception):
+    """Raised when an execution directory has no usable manifest."""
+
+class RunManifest:
+    """
+    Records which files and lines of a run are done, in a manifest.json file
+    inside the execution directory, so an interrupted run can be resumed.
+
+    For each output file it keeps the number of source lines already written
+    and the byte size of the output at that point. Progress is only recorded
+    after the output has been flushed, so on resume the output can safely be
+    truncated back to the recorded size and continued from the next line.
+    Files with lines that could not be commented are marked "incomplete",
+    with the failed line numbers, and are analyzed again on resume.
+    """
+    def __init__(self, execution_dir, source, options):
+        self.execution_dir = execution_dir
+        self.path = os.path.join(execution_dir, MANIFEST_FILENAME)
+        self.data = {
+            "version": MANIFEST_VERSION,
+            "source": source,
+            "options": options,
+            "created": time.time(),
+            "finished": None,
+            "files": {},
+        }
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+    @classmethod
+    def load(cls, execution_dir):
+        path = os.path.join(execution_dir, MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            raise ManifestError(f"No {MANIFEST_FILENAME} found in '{execution_dir}'. Is this a ThutorPy output directory?")
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            raise ManifestError(f"Unsupported manifest version in '{path}'.")
+        manifest = cls(execution_dir, data["source"], data.get("options", {}))
+        manifest.data = data
+        return manifest
+
+    @property
+    def source(self):
+        return self.data["source"]
+
+    @property
+    def options(self):
+        return self.data["options"]
+
+    def key_for(self, output_path):
+        return os.path.relpath(output_path, self.execution_dir).replace(os.sep, '/')
+
+    def start_file(self, output_path, source_hash, total_lines):
+        """
+        Registers a file about to be analyzed. Returns None if it is already
+        done, otherwise (lines_done, bytes_done) to resume from. Files whose
+        source changed since the checkpoint, whose partial output is missing,
+        or that finished with failed lines start again from the first line.
+        """
+        key = self.key_for(output_path)
+        with self._lock:
+            state = self.data["files"].get(key)
+            if state is not None and state.get("source_hash") == source_hash and state["status"] != "incomplete":
+                if state["status"] == "done" and os.path.exists(output_path):
+                    return None
+                if os.path.exists(output_path) and os.path.getsize(output_path) >= state["bytes_done"]:
+                    return state["lines_done"], state["bytes_done"]
+            self.data["files"][key] = {
+                "status": "in_progress",
+                "source_hash": source_hash,
+                "total_lines": total_lines,
+                "lines_done": 0,
+                "bytes_done": 0,
+            }
+        return 0, 0
+
+    def record_progress(self, output_path, lines_done, bytes_done):
+        key = self.key_for(output_path)
+        with self._lock:
+            state = self.data["files"][key]
+            state["lines_done"] = lines_done
+            state["bytes_done"] = bytes_done
+        self.save(force=False)
+
+    def finish_file(self, output_path, failed_lines=None):
+        key = self.key_for(output_path)
+        with self._lock:
+            state = self.data["files"][key]
+            if failed_lines:
+                state["status"] = "incomplete"
+                state["failed_lines"] = sorted(failed_lines)
+            else:
+                state["status"] = "done"
+                state.pop("failed_lines", None)
+        self.save()
+
+    def unfinished_files(self):
+        """
+        Returns {key: state} for the files that are not done: those with
+        failed lines, and those whose analysis stopped on an error.
+        """
+        with self._lock:
+            return {key: dict(state) for key, state in self.data["files"].items() if state["status"] != "done"}
+
+    def finish(self):
+        with self._lock:
+            self.data["finished"] = time.time()
+        self.save()
+
+    def save(self, force=True):
+        """Atomically rewrites the manifest; unforced saves are throttled."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_save < CHECKPOINT_INTERVAL:
+                return
+            self._last_save = now
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=4)
+            os.replace(temp_path, self.path)
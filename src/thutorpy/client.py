@@ -0,0 +1,281 @@
+import sys
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 300.0
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_KEEP_ALIVE = "30m"
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Consecutive failures after which an endpoint is taken out of rotation.
+UNHEALTHY_AFTER_FAILURES = 3
+UNHEALTHY_COOLDOWN = 5.0
+UNHEALTHY_COOLDOWN_MAX = 120.0
+# Weight of the newest sample in an endpoint's moving-average latency.
+LATENCY_SMOOTHING = 0.3
+
+class OllamaError(Exception):
+    """Raised when Ollama could not produce a response, even after retrying."""
+
+class Endpoint:
+    """
+    One Ollama server, with the load and health information the scheduler
+    uses: requests in flight, a moving-average latency and recent failures.
+    """
+    def __init__(self, url, weight=1.0, model=None):
+        self.url = url
+        self.weight = float(weight) if weight and float(weight) > 0 else 1.0
+        self.model = model or None
+        self.inflight = 0
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def is_healthy(self, now):
+        return now >= self.unhealthy_until
+
+    def score(self, default_latency):
+        """Expected wait for one more request: lower is better."""
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.inflight + 1) * latency / self.weight
+
+def parse_endpoints(config):
+    """
+    Reads the endpoints from the configuration. `OLLAMA_ENDPOINTS` is a list
+    of URLs or of objects with a `url` and an optional `weight` and `model`;
+    without it, `OLLAMA_API_URL` is the only endpoint.
+    """
+    entries = config.get("OLLAMA_ENDPOINTS") or [config["OLLAMA_API_URL"]]
+    endpoints = []
+    for entry in entries:
+        if isinstance(entry, str):
+            endpoints.append(Endpoint(entry))
+        else:
+            endpoints.append(Endpoint(entry["url"], entry.get("weight", 1.0), entry.get("model")))
+    return endpoints
+
+class OllamaClient:
+    """
+    HTTP client for Ollama's /api/generate endpoint on one or more servers.
+
+    A single pooled Session is shared by every request, so connections are
+    kept alive between lines. Requests have connect/read timeouts, and
+    connection errors, timeouts and 429/5xx responses are retried with
+    jittered exponential backoff. Every request carries `keep_alive` so the
+    model stays loaded between requests.
+
+    With several endpoints, each request goes to the healthy endpoint with
+    the lowest expected wait, based on its requests in flight, observed
+    latency and weight. Endpoints that keep failing are taken out of
+    rotation for a cooldown and put back once they answer again.
+    """
+    def __init__(
+        self,
+        endpoints,
+        pool_size=1,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        max_retries=DEFAULT_MAX_RETRIES,
+        keep_alive=DEFAULT_KEEP_ALIVE,
+        backoff_base=0.5,
+        backoff_max=30.0,
+    ):
+        if isinstance(endpoints, str):
+            endpoints = [Endpoint(endpoints)]
+        self.endpoints = list(endpoints)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.keep_alive = keep_alive
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Optional metrics.RunMetrics that records every request.
+        self.metrics = None
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(
+            pool_connections=len(self.endpoints),
+            pool_maxsize=max(1, pool_size),
+            max_retries=0
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_config(cls, config, pool_size=1):
+        return cls(
+            parse_endpoints(config),
+            pool_size=pool_size,
+            connect_timeout=config.get("OLLAMA_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+            read_timeout=config.get("OLLAMA_TIMEOUT", DEFAULT_READ_TIMEOUT),
+            max_retries=config.get("OLLAMA_MAX_RETRIES", DEFAULT_MAX_RETRIES),
+            keep_alive=config.get("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE),
+        )
+
+    def model_signature(self, default_model):
+        """Names every model this client may use, for keying cached comments."""
+        models = sorted({endpoint.model or default_model for endpoint in self.endpoints})
+        return "|".join(models)
+
+    def generate(self, payload, tag=None):
+        """
+        Sends a non-streaming generate request and returns the decoded JSON
+        response. Retries prefer an endpoint that has not failed this request.
+        `tag` (usually the file path) labels the request in the run metrics.
+        """
+        payload = dict(payload, stream=False)
+        if self.keep_alive is not None:
+            payload.setdefault("keep_alive", self.keep_alive)
+
+        attempt = 0
+        tried = set()
+        endpoint = self._acquire(tried)
+        while True:
+            tried.add(endpoint.url)
+            request = dict(payload, model=endpoint.model) if endpoint.model else payload
+            started = time.perf_counter()
+            try:
+                response = self.session.post(endpoint.url, json=request, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    result = response.json()
+                    elapsed = time.perf_counter() - started
+                    self._release(endpoint, elapsed)
+                    self._record(tag, endpoint, started, elapsed, response=result)
+                    return result
+                error = f"HTTP {response.status_code} from {endpoint.url}"
+                retry_after = _retry_after(response)
+                self._release(endpoint, failed=response.status_code != 429)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = f"{type(e).__name__}: {e}"
+                retry_after = None
+                self._release(endpoint, failed=True)
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or not 400 <= e.response.status_code < 500:
+                    self._release(endpoint, failed=True)
+                    self._record(tag, endpoint, started, time.perf_counter() - started, error=e)
+                    raise OllamaError(f"Request to {endpoint.url} failed: {e}") from e
+                # The server is up but rejected this request, for example with a 404 for
+                # a model it does not have: not a health failure, and another server may accept it.
+                self._release(endpoint)
+                self._record(tag, endpoint, started, time.perf_counter() - started, error=e)
+                endpoint = self._acquire(tried, untried_only=True)
+                if endpoint is None:
+                    raise OllamaError(f"Request rejected: {_error_message(e.response)}") from e
+                continue
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self._release(endpoint, failed=True)
+                self._record(tag, endpoint, started, time.perf_counter() - started, error=e)
+                raise OllamaError(f"Request to {endpoint.url} failed: {e}") from e
+
+            self._record(tag, endpoint, started, time.perf_counter() - started, error=error)
+            if attempt >= self.max_retries:
+                raise OllamaError(f"Giving up after {attempt + 1} attempts: {error}")
+            if self.metrics is not None:
+                self.metrics.count("retries")
+            delay = self._backoff(attempt, retry_after)
+            print(f"Ollama request failed ({error}), retrying in {delay:.1f}s...", file=sys.stderr)
+            time.sleep(delay)
+            attempt += 1
+            endpoint = self._acquire(tried)
+
+    def _record(self, tag, endpoint, started, elapsed, response=None, error=None):
+        if self.metrics is not None:
+            self.metrics.record_request(tag, endpoint.url, started, elapsed, response, error)
+
+    def _acquire(self, tried, untried_only=False):
+        """
+        Reserves the endpoint with the lowest expected wait for one request,
+        preferring endpoints not in `tried`. With `untried_only`, returns
+        None instead of an endpoint that was already tried.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e.is_healthy(now)]
+            if not candidates:
+                # Everything is out of rotation: try whichever comes back first.
+                candidates = [min(self.endpoints, key=lambda e: e.unhealthy_until)]
+            untried = [e for e in candidates if e.url not in tried]
+            if untried:
+                candidates = untried
+            elif untried_only:
+                return None
+
+            known = [e.latency for e in self.endpoints if e.latency is not None]
+            default_latency = min(known) if known else 1.0
+            endpoint = min(candidates, key=lambda e: e.score(default_latency))
+            endpoint.inflight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint, latency=None, failed=False):
+        with self._lock:
+            endpoint.inflight -= 1
+            if failed:
+                endpoint.errors += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= UNHEALTHY_AFTER_FAILURES:
+                    strikes = endpoint.consecutive_failures - UNHEALTHY_AFTER_FAILURES
+                    cooldown = min(UNHEALTHY_COOLDOWN_MAX, UNHEALTHY_COOLDOWN * (2 ** strikes))
+                    endpoint.unhealthy_until = time.monotonic() + cooldown
+                    if strikes == 0:
+                        print(f"Taking {endpoint.url} out of rotation for {cooldown:.0f}s.", file=sys.stderr)
+                return
+            if latency is not None:
+                if endpoint.consecutive_failures >= UNHEALTHY_AFTER_FAILURES:
+                    print(f"{endpoint.url} recovered, putting it back in rotation.", file=sys.stderr)
+                endpoint.consecutive_failures = 0
+                endpoint.unhealthy_until = 0.0
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    endpoint.latency += LATENCY_SMOOTHING * (latency - endpoint.latency)
+
+    def _backoff(self, attempt, retry_after=None):
+        # "Full jitter": a random delay up to the exponential cap spreads retries from many workers.
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def warm(self, default_model):
+        """
+        Asks every endpoint to load its model and keep it loaded for
+        `keep_alive`. An empty prompt loads the model without generating.
+        Returns the URLs of the endpoints that answered.
+        """
+        warmed = []
+        for endpoint in self.endpoints:
+            payload = {"model": endpoint.model or default_model, "prompt": "", "stream": False}
+            if self.keep_alive is not None:
+                payload["keep_alive"] = self.keep_alive
+            try:
+                self.session.post(endpoint.url, json=payload, timeout=self.timeout).raise_for_status()
+                warmed.append(endpoint.url)
+            except requests.exceptions.RequestException as e:
+                print(f"Could not warm up {endpoint.url}: {e}", file=sys.stderr)
+        return warmed
+
+    def close(self):
+        self.session.close()
+
+def _error_message(response):
+    """Returns the error Ollama sent with a response, such as "model 'x' not found"."""
+    try:
+        return f"HTTP {response.status_code} from {response.url}: {response.json()['error']}"
+    except (ValueError, KeyError, TypeError):
+        return f"HTTP {response.status_code} from {response.url}"
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
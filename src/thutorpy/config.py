@@ -70,6 +70,37 @@ def configure():
     if not api_url:
         api_url = default_api_url
 
+    # 3b. Additional endpoints
+    endpoints = [
+        endpoint if isinstance(endpoint, dict) else {"url": endpoint}
+        for endpoint in config.get("OLLAMA_ENDPOINTS", [])
+    ]
+    # The primary server keeps the weight and model it was configured with.
+    primary = next((endpoint for endpoint in endpoints if endpoint["url"] == api_url), {"url": api_url})
+    endpoints = [endpoint for endpoint in endpoints if endpoint["url"] != api_url]
+    if endpoints:
+        print("Currently configured additional endpoints:")
+        for endpoint in endpoints:
+            print(f"  - {endpoint['url']} (weight: {endpoint.get('weight', 1)}, model: {endpoint.get('model') or 'default'})")
+        keep_choice = input("Keep these endpoints? (y/n): ").lower().strip()
+        if keep_choice != 'y':
+            endpoints = []
+    while input("Do you want to add another Ollama server to share the load? (y/n): ").lower().strip() == 'y':
+        endpoint_url = input("Enter the Ollama API URL of the server (e.g. http://gpu-box:11434/api/generate): ").strip()
+        if not endpoint_url:
+            continue
+        endpoint = {"url": endpoint_url}
+        weight = input("Enter a weight for this server, higher gets more requests [default: 1]: ").strip()
+        try:
+            endpoint["weight"] = float(weight) if weight else 1
+        except ValueError:
+            print("Invalid weight, using 1.")
+            endpoint["weight"] = 1
+        endpoint_model = input("Enter the model to use on this server [default: the model chosen below]: ").strip()
+        if endpoint_model:
+            endpoint["model"] = endpoint_model
+        endpoints.append(endpoint)
+
     # 4. Set Output Directory
     default_output_dir = config.get("THUTORPY_OUTPUT_DIR", os.path.join(os.path.expanduser("~"), "thutorpy_output"))
     output_dir = input(f"Enter the base directory for output files [default: {default_output_dir}]: ").strip()
@@ -98,11 +129,17 @@ def configure():
             print("Invalid input. Please enter a number.")
 
     # 6. Save configuration
-    new_config = {
+    # Settings that are not asked about here, such as timeouts or the cache size, are kept.
+    new_config = dict(config)
+    new_config.update({
         "OLLAMA_API_URL": api_url,
         "THUTORPY_OUTPUT_DIR": output_dir,
         "OLLAMA_MODEL": selected_model
-    }
+    })
+    if endpoints or len(primary) > 1:
+        new_config["OLLAMA_ENDPOINTS"] = [primary] + endpoints
+    else:
+        new_config.pop("OLLAMA_ENDPOINTS", None)
 
     with open(CONFIG_PATH, 'w') as f:
         json.dump(new_config, f, indent=4)
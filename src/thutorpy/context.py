@@ -0,0 +1,198 @@
+import ast
+import os
+import re
+
+DEFAULT_CONTEXT_TOKENS = 2048
+
+# Rough size of a token in characters; good enough to stay under num_ctx.
+CHARS_PER_TOKEN = 4
+
+GAP_MARKER = "..."
+
+IMPORT_PATTERN = re.compile(
+    r"^\s*(import\s|from\s+\S+\s+import\s|#include\b|#import\b|using\s|require\b|use\s|package\s|extern\s+crate\b)"
+    r"|\brequire\(\s*['\"]"
+)
+SIGNATURE_PATTERN = re.compile(
+    r"^\s*(export\s+)?(default\s+)?(pub(\(\w+\))?\s+)?(async\s+)?"
+    r"(def|class|function|fn|func|interface|struct|enum|trait|impl|module|namespace|"
+    r"public|private|protected|internal|static|abstract|final|override|sub|proc)\b"
+)
+CLOSING_PATTERN = re.compile(r"^\s*([}\])]|end\b|fi\b|done\b|esac\b)")
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class ContextSelector:
+    """
+    Picks the code sent alongside each line: the file's imports and signatures,
+    followed by the largest enclosing scope that fits the token budget.
+
+    The file is parsed once, so selecting context per line stays cheap. Every
+    line of the same scope gets exactly the same context, which keeps the
+    prompt prefix stable for Ollama's prompt cache. A budget of 0 (or a file
+    that already fits) sends the whole file.
+    """
+    def __init__(self, code, file_path=None, token_budget=DEFAULT_CONTEXT_TOKENS):
+        self.code = code
+        self.lines = code.splitlines()
+        self.token_budget = token_budget
+        self.whole_file = token_budget <= 0 or estimate_tokens(code) <= token_budget
+        if self.whole_file:
+            return
+
+        tree = None
+        if file_path is None or os.path.splitext(file_path)[1] in (".py", ".pyw", ".pyi"):
+            try:
+                tree = ast.parse(code)
+            except (SyntaxError, ValueError):
+                tree = None
+
+        if tree is not None:
+            header, self.scopes = self._python_structure(tree)
+        else:
+            header, self.scopes = self._heuristic_header(), None
+        self.header = self._fit_header(header)
+
+    def for_lines(self, first, last):
+        """Returns the context for the 1-based, inclusive line range first..last."""
+        if self.whole_file:
+            return self.code
+
+        header_text = self._render(self.header)
+        remaining = self.token_budget - estimate_tokens(header_text)
+
+        candidates = self.scopes_for(first, last)
+        for start, end in candidates:
+            if estimate_tokens(self._render(range(start, end + 1))) <= remaining:
+                return self._join(header_text, start, end)
+
+        start, end = self._window(first, last, remaining)
+        return self._join(header_text, start, end)
+
+    def scopes_for(self, first, last):
+        """Enclosing scopes of the range as (start, end) pairs, outermost first."""
+        if self.scopes is not None:
+            enclosing = [(s, e) for s, e in self.scopes if s <= first and e >= last]
+            return sorted(enclosing, key=lambda scope: scope[0] - scope[1])
+        return list(reversed(self._heuristic_scopes(first, last)))
+
+    def _join(self, header_text, start, end):
+        body = self._render(range(start, end + 1))
+        if not header_text:
+            return body
+        return f"{header_text}\n{GAP_MARKER}\n{body}"
+
+    def _render(self, numbers):
+        """Renders 1-based line numbers, marking skipped stretches with a gap."""
+        rendered = []
+        previous = None
+        for number in numbers:
+            if previous is not None and number != previous + 1:
+                rendered.append(GAP_MARKER)
+            rendered.append(self.lines[number - 1])
+            previous = number
+        return "\n".join(rendered)
+
+    def _fit_header(self, numbers):
+        # Imports and signatures never take more than half of the budget.
+        limit = self.token_budget // 2
+        kept = []
+        used = 0
+        for number in numbers:
+            cost = estimate_tokens(self.lines[number - 1])
+            if used + cost > limit:
+                break
+            kept.append(number)
+            used += cost
+        return kept
+
+    def _window(self, first, last, budget):
+        """Grows a window around the range, one line on each side at a time, until the budget is spent."""
+        start, end = first, last
+        used = estimate_tokens(self._render(range(start, end + 1)))
+        while start > 1 or end < len(self.lines):
+            grew = False
+            if start > 1:
+                cost = estimate_tokens(self.lines[start - 2])
+                if used + cost <= budget:
+                    start -= 1
+                    used += cost
+                    grew = True
+            if end < len(self.lines):
+                cost = estimate_tokens(self.lines[end])
+                if used + cost <= budget:
+                    end += 1
+                    used += cost
+                    grew = True
+            if not grew:
+                break
+        return start, end
+
+    def _python_structure(self, tree):
+        header = set()
+        scopes = []
+
+        def visit(node, inside_function):
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.Import, ast.ImportFrom)) and not inside_function:
+                    header.update(range(child.lineno, child.end_lineno + 1))
+                elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    start = min([child.lineno] + [d.lineno for d in child.decorator_list])
+                    scopes.append((start, child.end_lineno))
+                    if not inside_function:
+                        signature_end = child.body[0].lineno - 1 if child.body else child.lineno
+                        header.update(range(start, max(child.lineno, signature_end) + 1))
+                    visit(child, inside_function or not isinstance(child, ast.ClassDef))
+                else:
+                    visit(child, inside_function)
+
+        visit(tree, False)
+        header = [n for n in sorted(header) if n <= len(self.lines) and self.lines[n - 1].strip()]
+        return header, scopes
+
+    def _heuristic_header(self):
+        header = []
+        for number, line in enumerate(self.lines, start=1):
+            if IMPORT_PATTERN.search(line):
+                header.append(number)
+            elif SIGNATURE_PATTERN.match(line) and self._indent(line) <= 4:
+                header.append(number)
+        return header
+
+    def _indent(self, line):
+        return len(line.expandtabs(4)) - len(line.expandtabs(4).lstrip())
+
+    def _heuristic_scopes(self, first, last):
+        """
+        Enclosing blocks found from indentation, innermost first. A block
+        starts at the nearest less-indented line above and ends before the
+        next line at or below that indentation, including a closing brace
+        or `end` keyword on that line.
+        """
+        body = [self.lines[n - 1] for n in range(first, last + 1) if self.lines[n - 1].strip()]
+        if not body:
+            return []
+        level = min(self._indent(line) for line in body)
+
+        scopes = []
+        number = first - 1
+        while level > 0 and number >= 1:
+            line = self.lines[number - 1]
+            if not line.strip() or self._indent(line) >= level or CLOSING_PATTERN.match(line):
+                number -= 1
+                continue
+
+            start = number
+            level = self._indent(line)
+            end = last
+            while end < len(self.lines):
+                following = self.lines[end]
+                if following.strip() and self._indent(following) <= level:
+                    if CLOSING_PATTERN.match(following):
+                        end += 1
+                    break
+                end += 1
+            scopes.append((start, end))
+            number -= 1
+        return scopes
@@ -1,68 +1,451 @@
 import os
-import requests
 import json
 import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import cache as comment_cache
+from . import triage
+from . import context as code_context
+from .client import OllamaClient, OllamaError
+from .metrics import RunMetrics
 
-def generate_comment_with_ollama(code_line, entire_code, ollama_api_url, ollama_model):
+# Bump whenever the prompts change, so cached comments from older prompts are not reused.
+PROMPT_VERSION = 2
+
+# Extra passes over lines whose requests failed, after the client's own retries.
+FAILED_LINE_RETRIES = 1
+
+# Minimum number of source lines analyzed and written to disk at a time.
+SEGMENT_LINES = 256
+
+# Finished comments kept for deduplication when the run has no cache.
+DEDUP_MEMORY = 100000
+
+class AnalysisEngine:
     """
-    Generates a comment for a line of code using Ollama, with the entire code for context.
+    Shared thread pool and HTTP client for Ollama requests. A single engine
+    is used for every file in a run, so `workers` bounds the number of
+    requests in flight across all files and lines.
+
+    The engine also coalesces identical requests: the first file to ask for
+    a (line, context) key claims it, and later occurrences wait for that
+    result instead of sending their own request. Once a comment arrives, later
+    occurrences find it in the cache, or in a bounded in-memory table of
+    recent comments when the cache is disabled.
+    """
+    def __init__(
+        self,
+        config,
+        workers=1,
+        batch_lines=1,
+        use_cache=True,
+        context_tokens=None,
+        metrics=None,
+        triage_mode=None,
+        dedup=True,
+    ):
+        self.config = config
+        self.workers = max(1, int(workers))
+        # Lines per request: 1 sends one request per line, 0 one request per segment.
+        self.batch_lines = max(0, int(batch_lines))
+        if context_tokens is None:
+            context_tokens = config.get("THUTORPY_CONTEXT_TOKENS", code_context.DEFAULT_CONTEXT_TOKENS)
+        # Token budget for the context sent with each request; 0 sends the whole file.
+        self.context_tokens = max(0, int(context_tokens))
+        # Lines written per output segment; each segment is checkpointed once written.
+        self.segment_lines = max(SEGMENT_LINES, self.workers * self.batch_lines * 8)
+        self.triage = triage_mode or config.get("THUTORPY_TRIAGE", triage.DEFAULT_TRIAGE_MODE)
+        self.dedup = dedup
+        self._claims = {}
+        self._finished = OrderedDict()
+        self._claims_lock = threading.Lock()
+        self.cache = comment_cache.open_cache(config) if use_cache else None
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.client = OllamaClient.from_config(config, pool_size=self.workers)
+        self.client.metrics = self.metrics
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="thutorpy")
+        self.cancelled = False
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def claim(self, key):
+        """
+        Returns (future, owner) for a request key. The owner must call
+        resolve(); everyone else waits on the future for the owner's result.
+        """
+        with self._claims_lock:
+            future = self._claims.get(key)
+            if future is not None:
+                return future, False
+            if key in self._finished:
+                self._finished.move_to_end(key)
+                future = Future()
+                future.set_result(self._finished[key])
+                return future, False
+            future = Future()
+            self._claims[key] = future
+            return future, True
+
+    def resolve(self, key, future, comment=None, error=None):
+        """
+        Settles a claim. Comments are expected in the cache by now, so the
+        claim itself is dropped; without a cache the comment is remembered
+        instead. Failed keys are forgotten so a later occurrence can try again.
+        """
+        with self._claims_lock:
+            if self._claims.get(key) is future:
+                del self._claims[key]
+            if error is None and self.cache is None:
+                self._finished[key] = comment
+                self._finished.move_to_end(key)
+                while len(self._finished) > DEDUP_MEMORY:
+                    self._finished.popitem(last=False)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(comment)
+
+    def close(self, cancel=False):
+        """
+        Waits for every request, then closes the client and the cache. With
+        `cancel`, queued requests are dropped and nothing is waited for; the
+        requests still in flight keep the client and cache until they return.
+        """
+        if cancel:
+            self.cancelled = True
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            return
+        self.executor.shutdown(wait=True)
+        self.client.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # On Ctrl-C or an error, do not send the rest of the queue first.
+        self.close(cancel=exc_type is not None)
+
+def generate_comment_with_ollama(code_line, context, client, ollama_model, tag=None):
+    """
+    Generates a comment for a line of code using Ollama, with the surrounding code for context.
+    Raises OllamaError if no comment could be generated.
     """
     prompt = (
         "You are an expert code commenter. Explain the following single line of code "
         "in a concise, one-sentence comment. Do not output anything else, just the comment text.\n\n"
-        f"The full code context is:\n```\n{entire_code}\n```\n\n"
+        f"{_context_block(context)}"
         f"The line to comment on is: \"{code_line}\""
     )
-    
+
+    response_json = client.generate({"model": ollama_model, "prompt": prompt}, tag=tag)
+    comment = clean_comment(response_json.get("response", ""))
+    if not comment:
+        raise OllamaError("Ollama returned an empty comment")
+    return comment
+
+def generate_comments_batch_with_ollama(numbered_lines, context, client, ollama_model, tag=None):
+    """
+    Generates comments for several lines in a single request, using Ollama's
+    JSON output mode. `numbered_lines` maps 1-based line numbers to code.
+
+    Returns a dict of line number to comment. Lines the model skipped are
+    missing from the result, and an empty dict is returned on any error.
+    """
+    listing = "\n".join(f"{number}: {line}" for number, line in numbered_lines.items())
+    prompt = (
+        "You are an expert code commenter. Explain each of the following lines of code "
+        "in a concise, one-sentence comment. Respond with a JSON object that maps each "
+        "line number (as a string) to its comment text, and nothing else.\n\n"
+        f"{_context_block(context)}"
+        f"Lines to comment (line number: code):\n{listing}"
+    )
+
     try:
-        response = requests.post(
-            ollama_api_url,
-            json={"model": ollama_model, "prompt": prompt, "stream": False},
-            headers={"Content-Type": "application/json"}
-        )
-        response.raise_for_status()
-        
-        response_json = response.json()
-        comment = response_json.get("response", "Could not get a comment.").strip()
-        return comment.replace('"', '').replace("'", "")
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error connecting to Ollama: {e}", file=sys.stderr)
-        return "Ollama connection error"
-
-def analyze_code(file_path, output_path, config):
+        response_json = client.generate({"model": ollama_model, "prompt": prompt, "format": "json"}, tag=tag)
+        mapping = json.loads(response_json.get("response", ""))
+    except OllamaError as e:
+        print(f"Batch request failed, falling back to single lines: {e}", file=sys.stderr)
+        return {}
+    except ValueError:
+        print("Ollama returned invalid JSON for a batch, falling back to single lines.", file=sys.stderr)
+        return {}
+
+    if not isinstance(mapping, dict):
+        return {}
+
+    comments = {}
+    for number in numbered_lines:
+        comment = mapping.get(str(number))
+        if isinstance(comment, str) and comment.strip():
+            comments[number] = clean_comment(comment)
+    return comments
+
+def _context_block(context):
+    # Context-free lines, such as imports, are sent without any surrounding code.
+    if not context:
+        return ""
+    return f"The code context is:\n```\n{context}\n```\n\n"
+
+def clean_comment(comment):
+    """Turns raw model output into a single-line comment."""
+    comment = " ".join(comment.split())
+    return comment.replace('"', '').replace("'", "")
+
+def _chunks(items, size):
+    if size <= 0:
+        return [items] if items else []
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def comment_lines(lines, code, config, engine, file_path=None, first=1, last=None, selector=None, failed_lines=None):
+    """
+    Returns a dict of 1-based line number to comment for every non-blank line
+    between `first` and `last` (inclusive, default: the whole file) that
+    could be commented. Pass a `selector` to reuse one parsed file across
+    several calls.
+
+    Lines are triaged first: trivial lines get a rule-based comment or none
+    at all, and imports are sent without context. Every other request
+    carries the context chosen by a `ContextSelector` rather than the whole
+    file. Lines found in the engine's cache are not sent to Ollama, and a
+    line already requested elsewhere in the run with the same context waits
+    for that request instead of sending its own.
+
+    With `engine.batch_lines` other than 1, lines are sent in chunks and any
+    line missing from a batch answer is retried with a single-line request.
+    Lines whose requests keep failing are reported and left out of the result;
+    their numbers are also added to `failed_lines`, if a list is given.
+    """
+    model = config['OLLAMA_MODEL']
+    model_key = engine.client.model_signature(model)
+    if selector is None:
+        selector = code_context.ContextSelector(code, file_path, engine.context_tokens)
+    if last is None:
+        last = len(lines)
+
+    comments = {}
+    scoped = []
+    context_free = []
+    comment_syntax = triage.comment_pattern(file_path)
+    for number in range(first, last + 1):
+        text = lines[number - 1].strip()
+        if not text:
+            continue
+        action, rule_comment = triage.classify(text, engine.triage, comment_syntax)
+        if action == triage.SKIP:
+            engine.metrics.count("triage_skipped")
+        elif action == triage.RULE:
+            comments[number] = rule_comment
+            engine.metrics.count("triage_rule_comments")
+        elif engine.triage != "off" and triage.is_context_free(text):
+            context_free.append((number, text))
+        else:
+            scoped.append((number, text))
+
+    # A unit is one request's worth of lines, all sharing the same context.
+    units = [(dict(chunk), "") for chunk in _chunks(context_free, engine.batch_lines)]
+    for chunk in _chunks(scoped, engine.batch_lines):
+        units.append((dict(chunk), selector.for_lines(chunk[0][0], chunk[-1][0])))
+
+    keys = {}
+    claims = {}
+    waiting = {}
+    missing_units = []
+    for numbered_lines, context in units:
+        missing = {}
+        for number, text in numbered_lines.items():
+            keys[number] = comment_cache.make_key(model_key, PROMPT_VERSION, text, context)
+            if engine.cache is not None:
+                cached = engine.cache.get(keys[number])
+                if cached is not None:
+                    comments[number] = cached
+                    engine.metrics.count("cache_hits")
+                    continue
+                engine.metrics.count("cache_misses")
+            if engine.dedup:
+                claim, owner = engine.claim(keys[number])
+                if not owner:
+                    waiting[number] = claim
+                    engine.metrics.count("deduplicated")
+                    continue
+                claims[number] = claim
+            missing[number] = text
+        if missing:
+            missing_units.append((missing, context))
+
+    def resolve(number, comment):
+        # Cache each comment as it arrives, so an interrupted run keeps it.
+        if engine.cache is not None:
+            engine.cache.put(keys[number], comment)
+        if number in claims:
+            engine.resolve(keys[number], claims.pop(number), comment)
+
+    generated = {}
+    failed = {}
+    try:
+        generated, failed = _request_comments(missing_units, model, engine, file_path, resolve)
+        for attempt in range(FAILED_LINE_RETRIES):
+            if not failed:
+                break
+            print(f"Retrying {len(failed)} failed line(s) in {file_path}...", file=sys.stderr)
+            retried, failed = _request_comments(
+                [({number: text}, context) for number, (text, context) in failed.items()],
+                model, engine, file_path, resolve
+            )
+            generated.update(retried)
+    finally:
+        # Lines other files are waiting on but that got no comment.
+        for number, claim in list(claims.items()):
+            engine.resolve(keys[number], claim, error=OllamaError(f"No comment for line {number} of {file_path}"))
+
+    for number, claim in waiting.items():
+        try:
+            generated[number] = claim.result()
+        except OllamaError:
+            failed[number] = (lines[number - 1].strip(), None)
+
+    if failed:
+        engine.metrics.count("failed_lines", len(failed))
+        numbers = ", ".join(str(number) for number in sorted(failed))
+        print(f"Could not comment {len(failed)} line(s) in {file_path} (lines {numbers}).", file=sys.stderr)
+        if failed_lines is not None:
+            failed_lines.extend(failed)
+
+    comments.update(generated)
+    engine.metrics.count("lines_commented", len(comments))
+    return comments
+
+def _request_comments(units, model, engine, tag=None, on_result=None):
+    """
+    Sends the units to Ollama. Returns the generated comments and a dict of
+    line number to (text, context) for lines whose requests failed.
+    `on_result(number, comment)` is called as soon as each comment arrives.
+    """
+    client = engine.client
+    requests_sent = []
+    for numbered_lines, context in units:
+        if len(numbered_lines) == 1:
+            (number, text), = numbered_lines.items()
+            future = engine.submit(generate_comment_with_ollama, text, context, client, model, tag)
+        else:
+            future = engine.submit(generate_comments_batch_with_ollama, numbered_lines, context, client, model, tag)
+        requests_sent.append((numbered_lines, context, future))
+
+    comments = {}
+    failed = {}
+    fallbacks = {}
+    for numbered_lines, context, future in requests_sent:
+        if len(numbered_lines) == 1:
+            (number, text), = numbered_lines.items()
+            fallbacks[number] = (text, context, future)
+            continue
+        answered = future.result()
+        comments.update(answered)
+        for number, text in numbered_lines.items():
+            if number in answered:
+                if on_result is not None:
+                    on_result(number, answered[number])
+                continue
+            engine.metrics.count("batch_fallback_lines")
+            future = engine.submit(generate_comment_with_ollama, text, context, client, model, tag)
+            fallbacks[number] = (text, context, future)
+
+    for number, (text, context, future) in fallbacks.items():
+        try:
+            comments[number] = future.result()
+        except OllamaError as e:
+            print(f"Error getting a comment for line {number}: {e}", file=sys.stderr)
+            failed[number] = (text, context)
+            continue
+        if on_result is not None:
+            on_result(number, comments[number])
+    return comments, failed
+
+def analyze_code(file_path, output_path, config, engine=None, manifest=None):
     """
     Analyzes the code in the given file and adds comments line by line,
     saving the output to the specified output_path.
+
+    Requests are submitted to `engine` so they can run concurrently. The
+    file is processed in segments of `engine.segment_lines` lines, and each
+    segment is written to disk, in the original line order, as soon as it is
+    complete, so memory stays bounded on large files. With a `manifest`,
+    progress is checkpointed after every segment and a partially written
+    file is resumed from its last checkpoint; a file with lines that could
+    not be commented is recorded as incomplete. Without an engine, a
+    single-worker engine is used for this file only.
+
+    Returns output_path, or None if the file was skipped or failed.
     """
+    if engine is None:
+        with AnalysisEngine(config) as own_engine:
+            return analyze_code(file_path, output_path, config, own_engine, manifest)
+
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             code = f.read()
         lines = code.splitlines()
-        
-        new_lines = []
-        for line in lines:
-            if line.strip():
-                comment = generate_comment_with_ollama(
-                    line.strip(), 
-                    code, 
-                    config['OLLAMA_API_URL'], 
-                    config['OLLAMA_MODEL']
-                )
-                new_lines.append(f"{line}  # {comment}")
-            else:
-                new_lines.append(line)
-                
-        commented_code = "\n".join(new_lines)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(commented_code)
-        
-        return commented_code
+
+        lines_done, bytes_done = 0, 0
+        if manifest is not None:
+            source_hash = hashlib.sha256(code.encode('utf-8')).hexdigest()
+            progress = manifest.start_file(output_path, source_hash, len(lines))
+            if progress is None:
+                print(f"Already done: {file_path}")
+                return output_path
+            lines_done, bytes_done = progress
+        if lines_done:
+            print(f"Resuming {file_path} at line {lines_done + 1} of {len(lines)}")
+        else:
+            print(f"Analyzing: {file_path}")
+
+        started = time.perf_counter()
+        selector = code_context.ContextSelector(code, file_path, engine.context_tokens)
+        segment = engine.segment_lines
+        commented = 0
+        failed_lines = []
+
+        with open(output_path, 'r+b' if lines_done else 'wb') as f:
+            if lines_done:
+                f.truncate(bytes_done)
+                f.seek(bytes_done)
+            for first in range(lines_done + 1, len(lines) + 1, segment):
+                last = min(len(lines), first + segment - 1)
+                comments = comment_lines(lines, code, config, engine, file_path, first, last, selector, failed_lines)
+                commented += len(comments)
+
+                new_lines = []
+                for number in range(first, last + 1):
+                    line = lines[number - 1]
+                    if number in comments:
+                        new_lines.append(f"{line}  # {comments[number]}")
+                    else:
+                        new_lines.append(line)
+                chunk = "\n".join(new_lines)
+                if last < len(lines):
+                    chunk += "\n"
+
+                f.write(chunk.encode('utf-8'))
+                f.flush()
+                if manifest is not None:
+                    manifest.record_progress(output_path, last, f.tell())
+
+        if manifest is not None:
+            manifest.finish_file(output_path, failed_lines)
+        engine.metrics.record_file(file_path, started, time.perf_counter() - started, len(lines) - lines_done, commented)
+        return output_path
 
     except (UnicodeDecodeError, IsADirectoryError):
         print(f"Skipping file (not a text file): {file_path}", file=sys.stderr)
         return None
     except Exception as e:
+        if engine.cancelled:
+            # The run was interrupted; the manifest keeps this file's progress.
+            return None
         print(f"Error analyzing file {file_path}: {e}", file=sys.stderr)
-        return None
\ No newline at end of file
+        return None
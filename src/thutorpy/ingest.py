@@ -0,0 +1,197 @@
+import os
+import fnmatch
+import subprocess
+
+DEFAULT_MAX_FILE_SIZE = 256 * 1024
+
+# Bytes read from the start of each file to detect binaries and minified code.
+SNIFF_SIZE = 8192
+# A sample with lines this long on average is treated as minified or generated.
+MINIFIED_LINE_LENGTH = 300
+
+DEFAULT_EXCLUDES = [
+    # Vendored dependencies, virtualenvs and build output
+    ".git/", "node_modules/", "bower_components/", "vendor/", "third_party/", "third-party/",
+    ".venv/", "venv/", "__pycache__/", "dist/", "build/", "target/",
+    # Minified and generated assets
+    "*.min.js", "*.min.css", "*.bundle.js", "*.map",
+    # Lock files
+    "*.lock", "package-lock.json", "npm-shrinkwrap.json", "pnpm-lock.yaml", "go.sum",
+]
+
+class IngestError(Exception):
+    """Raised when a repository cannot be cloned or listed."""
+
+def is_remote(source):
+    return source.startswith(('http://', 'https://', 'git://', 'ssh://', 'file://', 'git@'))
+
+def is_repository(source):
+    """Remote URLs, local directories and local bare repositories can all be ingested."""
+    return is_remote(source) or os.path.isdir(source)
+
+def is_bare_repository(path):
+    result = _git(['rev-parse', '--is-bare-repository'], cwd=path, check=False)
+    return result.returncode == 0 and result.stdout.strip() == "true"
+
+def is_work_tree(path):
+    result = _git(['rev-parse', '--is-inside-work-tree'], cwd=path, check=False)
+    return result.returncode == 0 and result.stdout.strip() == "true"
+
+def _git(args, cwd=None, check=True, input=None):
+    result = subprocess.run(['git'] + args, cwd=cwd, capture_output=True, text=True, input=input)
+    if check and result.returncode != 0:
+        raise IngestError(f"git {args[0]} failed: {result.stderr.strip()}")
+    return result
+
+def clone_repository(source, dest, max_file_size=DEFAULT_MAX_FILE_SIZE):
+    """
+    Makes a shallow, blob-filtered clone of `source` into `dest` without
+    checking anything out. Files larger than `max_file_size` are never
+    downloaded.
+
+    Returns a list of (relative path, size) for every regular file at HEAD;
+    the size is None for files that were filtered out as too large.
+    """
+    args = ['clone', '--quiet', '--depth', '1', '--no-checkout']
+    if max_file_size:
+        args.append(f'--filter=blob:limit={max_file_size}')
+    if not is_remote(source):
+        # Local clones only honour --depth and --filter over the file:// transport.
+        source = "file://" + os.path.abspath(source)
+        args += ['--upload-pack', 'git -c uploadpack.allowFilter=true upload-pack']
+    result = _git(args + [source, dest], check=False)
+    if result.returncode != 0:
+        raise IngestError(f"Could not clone '{source}'. Please check the URL and your permissions.\n{result.stderr.strip()}")
+
+    tree = _git(['ls-tree', '-r', '-z', 'HEAD'], cwd=dest).stdout
+    blobs = []
+    for entry in tree.split('\0'):
+        if not entry:
+            continue
+        meta, path = entry.split('\t', 1)
+        mode, kind, sha = meta.split()
+        # Skip symlinks (120000) and submodules (commits).
+        if kind == 'blob' and mode in ('100644', '100755'):
+            blobs.append((path, sha))
+
+    missing = set()
+    objects = _git(['rev-list', '--objects', '--missing=print', 'HEAD'], cwd=dest).stdout
+    for line in objects.splitlines():
+        if line.startswith('?'):
+            missing.add(line[1:].strip())
+
+    present = [sha for _, sha in blobs if sha not in missing]
+    sizes = {}
+    if present:
+        batch = _git(['cat-file', '--batch-check=%(objectname) %(objectsize)'], cwd=dest, input="\n".join(present) + "\n").stdout
+        for line in batch.splitlines():
+            sha, size = line.split()
+            sizes[sha] = int(size)
+
+    return [(path, sizes.get(sha)) for path, sha in blobs]
+
+def checkout_files(dest, paths):
+    """Checks out only the given files of a clone made by clone_repository."""
+    if not paths:
+        return
+    _git(
+        ['checkout', '--quiet', 'HEAD', '--pathspec-from-file=-', '--pathspec-file-nul'],
+        cwd=dest,
+        input="\0".join(paths) + "\0"
+    )
+
+def list_work_tree(root):
+    """
+    Lists the files of a local directory as (relative path, size). Inside a
+    git work tree, `git ls-files` is used so .gitignore is respected.
+    """
+    if is_work_tree(root):
+        output = _git(['ls-files', '-z', '--cached', '--others', '--exclude-standard'], cwd=root).stdout
+        paths = [path for path in output.split('\0') if path]
+    else:
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d != '.git']
+            for filename in filenames:
+                paths.append(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/'))
+
+    entries = []
+    for path in sorted(paths):
+        full_path = os.path.join(root, path)
+        if os.path.islink(full_path) or not os.path.isfile(full_path):
+            continue
+        entries.append((path, os.path.getsize(full_path)))
+    return entries
+
+def matches(path, pattern):
+    """
+    Matches a relative path against a glob. Patterns ending in '/' match a
+    directory anywhere in the path, patterns without '/' match the file
+    name, and other patterns match the whole path.
+    """
+    parts = path.split('/')
+    if pattern.endswith('/'):
+        directory = pattern.rstrip('/')
+        if '/' in directory:
+            return fnmatch.fnmatch(path, directory + '/*')
+        return any(fnmatch.fnmatch(part, directory) for part in parts[:-1])
+    if '/' in pattern:
+        return fnmatch.fnmatch(path, pattern.lstrip('/'))
+    return fnmatch.fnmatch(parts[-1], pattern)
+
+def select_files(entries, include=None, exclude=None, max_file_size=DEFAULT_MAX_FILE_SIZE, default_excludes=True):
+    """
+    Filters (path, size) entries by include/exclude globs and size. Returns
+    the selected paths and a dict counting skipped files per reason.
+    """
+    excludes = (DEFAULT_EXCLUDES if default_excludes else []) + list(exclude or [])
+    selected = []
+    skipped = {}
+    for path, size in entries:
+        if include and not any(matches(path, pattern) for pattern in include):
+            reason = "not included"
+        elif any(matches(path, pattern) for pattern in excludes):
+            reason = "excluded"
+        elif size is None or (max_file_size and size > max_file_size):
+            reason = "too large"
+        elif size == 0:
+            reason = "empty"
+        else:
+            selected.append(path)
+            continue
+        skipped[reason] = skipped.get(reason, 0) + 1
+    return selected, skipped
+
+def sniff(path):
+    """
+    Looks at the start of a file and returns why it should be skipped
+    ('binary' or 'minified'), or None if it looks like source code.
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(SNIFF_SIZE)
+    if b'\0' in sample:
+        return "binary"
+    try:
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample is fine.
+        if e.start < len(sample) - 3:
+            return "binary"
+    lines = sample.count(b'\n') + 1
+    if len(sample) >= 1024 and len(sample) / lines > MINIFIED_LINE_LENGTH:
+        return "minified"
+    return None
+
+def sniff_files(root, paths, skipped):
+    """Drops binary and minified files from `paths`, counting them in `skipped`."""
+    kept = []
+    for path in paths:
+        reason = sniff(os.path.join(root, path))
+        if reason is None:
+            kept.append(path)
+        else:
+            skipped[reason] = skipped.get(reason, 0) + 1
+    return kept
+
+def describe_skipped(skipped):
+    return ", ".join(f"{count} {reason}" for reason, count in sorted(skipped.items())) or "none"
@@ -2,97 +2,401 @@ import argparse
 import sys
 import os
 import tempfile
-import subprocess
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from . import core
+from . import checkpoint
+from . import cache as comment_cache
+from . import ingest
+from . import triage
+from . import metrics as run_metrics
 from . import config as app_config
 
-def is_git_repo(url):
-    return url.startswith(('http://', 'https://')) and 'github.com' in url
-
-def process_file(file_path, output_dir, config):
-    print(f"Analyzing: {file_path}")
+def process_file(file_path, output_dir, config, engine=None, manifest=None):
     output_path = os.path.join(output_dir, os.path.basename(file_path))
-    core.analyze_code(file_path, output_path, config)
+    core.analyze_code(file_path, output_path, config, engine, manifest)
 
-def process_repository(repo_url, output_dir, config):
+def analyze_files(jobs, config, engine, manifest=None):
+    """
+    Analyzes (file_path, output_path) pairs concurrently. Files only wait on
+    their own lines, so the engine's pool stays busy across file boundaries.
+    """
+    if not jobs:
+        return
+    file_pool = ThreadPoolExecutor(max_workers=min(engine.workers, len(jobs)))
     try:
-        # Check if the repository exists before trying to clone
-        result = subprocess.run(
-            ['git', 'ls-remote', repo_url],
-            check=False,
-            capture_output=True,
-            text=True
-        )
-        if result.returncode != 0:
-            print(f"Error: The repository at '{repo_url}' does not seem to exist.", file=sys.stderr)
-            sys.exit(1)
+        futures = [
+            file_pool.submit(core.analyze_code, file_path, output_path, config, engine, manifest)
+            for file_path, output_path in jobs
+        ]
+        for future in futures:
+            future.result()
+    except BaseException:
+        # On Ctrl-C, do not start the remaining files before stopping.
+        file_pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    file_pool.shutdown()
+
+def process_repository(repo_url, output_dir, config, engine=None, manifest=None):
+    """
+    Analyzes every selected file of a repository. Remote URLs and local bare
+    repositories are shallow-cloned; local directories are read in place.
+    """
+    try:
+        if os.path.isdir(repo_url) and not ingest.is_bare_repository(repo_url):
+            print(f"Listing files in: {repo_url}")
+            entries = ingest.list_work_tree(repo_url)
+            analyze_repository_files(repo_url, entries, output_dir, config, engine, manifest=manifest)
+            return
 
         with tempfile.TemporaryDirectory() as temp_dir:
             print(f"Cloning repository: {repo_url}")
-            result = subprocess.run(
-                ['git', 'clone', repo_url, temp_dir], 
-                check=False,
-                capture_output=True, 
-                text=True
+            entries = ingest.clone_repository(
+                repo_url,
+                temp_dir,
+                config.get("THUTORPY_MAX_FILE_SIZE", ingest.DEFAULT_MAX_FILE_SIZE)
             )
-            
-            if result.returncode != 0:
-                print(f"Error cloning repository. Please check the URL and your permissions.", file=sys.stderr)
-                print(f"Git error: {result.stderr}", file=sys.stderr)
-                sys.exit(1)
-
             print("Repository cloned successfully.")
-            for root, _, files in os.walk(temp_dir):
-                if '.git' in root.split(os.sep):
-                    continue
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            f.read(1024)
-                        relative_path = os.path.relpath(file_path, temp_dir)
-                        output_path = os.path.join(output_dir, relative_path)
-                        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                        print(f"Analyzing: {file_path}")
-                        core.analyze_code(file_path, output_path, config)
-                    except (UnicodeDecodeError, IsADirectoryError):
-                        print(f"Skipping binary file: {file_path}", file=sys.stderr)
-                        continue
+            analyze_repository_files(temp_dir, entries, output_dir, config, engine, checkout=True, manifest=manifest)
+    except ingest.IngestError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
     except Exception as e:
         print(f"An error occurred: {e}", file=sys.stderr)
         sys.exit(1)
 
-def main():
-    parser = argparse.ArgumentParser(description="Analyze a file or GitHub repository and save the commented code.")
-    parser.add_argument("path", help="The local file path or GitHub repository URL to analyze.")
-    args = parser.parse_args()
+def analyze_repository_files(root, entries, output_dir, config, engine=None, checkout=False, manifest=None):
+    """
+    Selects files by glob, size and content, then analyzes them. Everything
+    is filtered out before any request is sent to Ollama.
+    """
+    paths, skipped = ingest.select_files(
+        entries,
+        include=config.get("THUTORPY_INCLUDE"),
+        exclude=config.get("THUTORPY_EXCLUDE"),
+        max_file_size=config.get("THUTORPY_MAX_FILE_SIZE", ingest.DEFAULT_MAX_FILE_SIZE),
+        default_excludes=config.get("THUTORPY_DEFAULT_EXCLUDES", True)
+    )
+    if checkout:
+        ingest.checkout_files(root, paths)
+    paths = ingest.sniff_files(root, paths, skipped)
+    print(f"Selected {len(paths)} of {len(entries)} files (skipped: {ingest.describe_skipped(skipped)}).")
+
+    jobs = []
+    for relative_path in paths:
+        file_path = os.path.join(root, relative_path)
+        output_path = os.path.join(output_dir, relative_path)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        jobs.append((file_path, output_path))
+
+    if engine is None:
+        with core.AnalysisEngine(config) as own_engine:
+            analyze_files(jobs, config, own_engine, manifest)
+    else:
+        analyze_files(jobs, config, engine, manifest)
+
+def cache_main(argv):
+    parser = argparse.ArgumentParser(prog="thutorpy cache", description="Inspect or prune the comment cache.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="Show the number of cached comments and the cache size.")
+    prune_parser = subparsers.add_parser("prune", help="Evict least recently used comments.")
+    prune_parser.add_argument(
+        "--max-size",
+        type=float,
+        default=None,
+        metavar="MB",
+        help="Shrink the cache to this many megabytes; 0 clears it (default: the configured limit)."
+    )
+    args = parser.parse_args(argv)
 
     config = app_config.load_config()
-    output_dir = config["THUTORPY_OUTPUT_DIR"]
+    cache = comment_cache.open_cache(config)
+    try:
+        if args.command == "stats":
+            stats = cache.stats()
+            print(f"Cache file: {stats['path']}")
+            print(f"Entries: {stats['entries']}")
+            print(f"Size: {stats['size_bytes'] / (1024 * 1024):.2f} MB of {stats['max_size_bytes'] / (1024 * 1024):.2f} MB")
+        elif args.command == "prune":
+            max_bytes = None if args.max_size is None else int(args.max_size * 1024 * 1024)
+            removed = cache.prune(max_bytes)
+            print(f"Removed {removed} cached comments.")
+    finally:
+        cache.close()
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Analyze a file, directory or git repository and save the commented code.",
+        epilog="Run 'thutorpy cache {stats,prune}' to manage the comment cache, "
+               "'thutorpy serve' to start a daemon and 'thutorpy submit' to hand work to it."
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        help="The local file, directory, bare repository or git repository URL to analyze."
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="EXECUTION_DIR",
+        default=None,
+        help="Continue an interrupted run in its output directory, analyzing only what is left."
+    )
+    add_engine_arguments(parser)
+    add_selection_arguments(parser)
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Also write a Chrome trace of every request (trace.json) into the output directory."
+    )
+    return parser
+
+def add_engine_arguments(parser):
+    """Options that configure the analysis engine: concurrency, prompting, HTTP client and cache."""
+    parser.add_argument(
+        "--workers", "--max-inflight",
+        dest="workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Maximum number of Ollama requests in flight across all files and lines (default: 1)."
+    )
+    parser.add_argument(
+        "--batch-lines",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Number of lines to comment per request; 0 sends each segment of 256 lines at once (default: 1)."
+    )
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Approximate token budget for the code sent with each request; 0 sends the whole file (default: 2048)."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Read timeout for each Ollama request (default: 300)."
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Number of retries for a failed Ollama request (default: 4)."
+    )
+    parser.add_argument(
+        "--triage",
+        choices=triage.TRIAGE_MODES,
+        default=None,
+        help="How to handle trivial lines such as '}', 'else:' or 'pass': 'rules' gives them a "
+             "canned comment where one exists, 'skip' leaves them uncommented, 'off' sends them "
+             "to the model (default: rules)."
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Send every line to the model, even if the same line and context were already requested in this run."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the comment cache for this run."
+    )
+
+def add_selection_arguments(parser):
+    """Options that choose which repository files are analyzed."""
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=None,
+        metavar="GLOB",
+        help="Only analyze repository files matching this glob; can be repeated (e.g. '*.py', 'src/')."
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=None,
+        metavar="GLOB",
+        help="Skip repository files matching this glob; can be repeated."
+    )
+    parser.add_argument(
+        "--no-default-excludes",
+        action="store_true",
+        help="Also analyze vendored directories, minified assets and lock files."
+    )
+    parser.add_argument(
+        "--max-file-size",
+        type=int,
+        default=None,
+        metavar="KB",
+        help="Skip repository files larger than this; 0 disables the limit (default: 256)."
+    )
+
+def apply_options(config, args):
+    """
+    Validates the command-line options and copies the ones that live in the
+    configuration into `config`. Returns (workers, batch_lines).
+    """
+    workers = args.workers if args.workers is not None else config.get("THUTORPY_WORKERS", 1)
+    if workers < 1:
+        print("Error: --workers must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+
+    batch_lines = args.batch_lines if args.batch_lines is not None else config.get("THUTORPY_BATCH_LINES", 1)
+    if batch_lines < 0:
+        print("Error: --batch-lines cannot be negative.", file=sys.stderr)
+        sys.exit(1)
+
+    if args.context_tokens is not None and args.context_tokens < 0:
+        print("Error: --context-tokens cannot be negative.", file=sys.stderr)
+        sys.exit(1)
 
+    if args.timeout is not None:
+        config["OLLAMA_TIMEOUT"] = args.timeout
+    if args.retries is not None:
+        config["OLLAMA_MAX_RETRIES"] = args.retries
+    if args.include:
+        config["THUTORPY_INCLUDE"] = args.include
+    if args.exclude:
+        config["THUTORPY_EXCLUDE"] = args.exclude
+    if args.no_default_excludes:
+        config["THUTORPY_DEFAULT_EXCLUDES"] = False
+    if args.max_file_size is not None:
+        config["THUTORPY_MAX_FILE_SIZE"] = args.max_file_size * 1024
+    return workers, batch_lines
+
+def merge_options(saved, args):
+    """
+    Returns the options of a resumed run: those saved in its manifest,
+    overridden by any option given again on the command line.
+    """
+    merged = vars(build_parser().parse_args([]))
+    merged.update(saved)
+    for key, value in vars(args).items():
+        if key not in ("path", "resume") and value is not None and value is not False:
+            merged[key] = value
+    return argparse.Namespace(**merged)
+
+def new_execution_dir(output_dir, path):
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    sanitized_path = os.path.basename(args.path).replace('.git', '')
+    sanitized_path = os.path.basename(os.path.normpath(path)).replace('.git', '')
     execution_dir_name = f"{timestamp}_{sanitized_path}"
-    execution_dir = os.path.join(output_dir, execution_dir_name)
-    
-    os.makedirs(execution_dir, exist_ok=True)
-    abs_execution_dir = os.path.abspath(execution_dir)
-    print(f"Output will be saved to: {abs_execution_dir}")
+    return os.path.join(output_dir, execution_dir_name)
 
-    if is_git_repo(args.path):
-        process_repository(args.path, execution_dir, config)
-    elif os.path.isfile(args.path):
-        process_file(args.path, execution_dir, config)
+def run_analysis(path, execution_dir, config, engine, manifest=None):
+    if os.path.isfile(path):
+        process_file(path, execution_dir, config, engine, manifest)
+    elif ingest.is_repository(path):
+        process_repository(path, execution_dir, config, engine, manifest)
     else:
-        print(f"Error: The path '{args.path}' is not a valid file or GitHub repository URL.", file=sys.stderr)
+        print(f"Error: The path '{path}' is not a valid file, directory or repository URL.", file=sys.stderr)
         sys.exit(1)
 
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["cache"]:
+        cache_main(argv[1:])
+        return
+    if argv[:1] in (["serve"], ["submit"]):
+        from . import server
+        if argv[0] == "serve":
+            server.serve_main(argv[1:])
+        else:
+            server.submit_main(argv[1:])
+        return
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.resume and args.path:
+        parser.error("give either a path or --resume, not both")
+    if not args.resume and not args.path:
+        parser.error("a path to analyze is required")
+
+    config = app_config.load_config()
+    output_dir = config["THUTORPY_OUTPUT_DIR"]
+
+    resuming = bool(args.resume)
+    if resuming:
+        try:
+            manifest = checkpoint.RunManifest.load(args.resume)
+        except checkpoint.ManifestError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        execution_dir = args.resume
+        args = merge_options(manifest.options, args)
+        path = manifest.source
+        workers, batch_lines = apply_options(config, args)
+        print(f"Resuming run of: {path}")
+    else:
+        path = args.path
+        workers, batch_lines = apply_options(config, args)
+        execution_dir = new_execution_dir(output_dir, path)
+        os.makedirs(execution_dir, exist_ok=True)
+        source = path if ingest.is_remote(path) else os.path.abspath(path)
+        options = {key: value for key, value in vars(args).items() if key not in ("path", "resume")}
+        manifest = checkpoint.RunManifest(execution_dir, source, options)
+        manifest.save()
+
+    abs_execution_dir = os.path.abspath(execution_dir)
+    print(f"Output will be saved to: {abs_execution_dir}")
+
+    trace_path = os.path.join(execution_dir, run_metrics.TRACE_FILENAME) if args.trace else None
+    metrics = run_metrics.RunMetrics(trace_path, append=resuming)
+    if resuming:
+        metrics.load(execution_dir)
+
+    try:
+        with core.AnalysisEngine(
+            config,
+            workers,
+            batch_lines,
+            use_cache=not args.no_cache,
+            context_tokens=args.context_tokens,
+            metrics=metrics,
+            triage_mode=args.triage,
+            dedup=not args.no_dedup
+        ) as engine:
+            run_analysis(path, execution_dir, config, engine, manifest)
+    except KeyboardInterrupt:
+        manifest.save()
+        metrics.write(execution_dir)
+        print("\nInterrupted. Completed lines are saved; to continue, run:", file=sys.stderr)
+        print(f"thutorpy --resume {abs_execution_dir}", file=sys.stderr)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Requests already in flight would otherwise hold up the exit until they return.
+        os._exit(130)
+
+    manifest.finish()
+    metrics_path = metrics.write(execution_dir)
+    unfinished = manifest.unfinished_files()
+
     print("\n" + "="*50)
-    print("✅ Analysis complete!")
+    if unfinished:
+        print(f"⚠️ Analysis finished, but {len(unfinished)} file(s) are incomplete:")
+        for key, state in sorted(unfinished.items()):
+            if state.get("failed_lines"):
+                print(f"  {key}: {len(state['failed_lines'])} line(s) without a comment")
+            else:
+                print(f"  {key}: stopped on an error")
+        print(f"To request them again, run:\nthutorpy --resume {abs_execution_dir}")
+    else:
+        print("✅ Analysis complete!")
     print(f"Commented files are saved in: {abs_execution_dir}")
     print(f"To navigate to the output directory, you can run:\ncd {abs_execution_dir}")
+    print("="*50)
+    metrics.print_summary()
+    print(f"  Metrics saved to: {os.path.abspath(metrics_path)}")
+    if trace_path:
+        print(f"  Trace saved to: {os.path.abspath(trace_path)}")
     print("="*50 + "\n")
+    if unfinished:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import threading
+
+METRICS_FILENAME = "metrics.json"
+TRACE_FILENAME = "trace.json"
+
+# Timing fields Ollama reports for each request, in nanoseconds.
+OLLAMA_DURATIONS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+OLLAMA_COUNTS = ("prompt_eval_count", "eval_count")
+
+def _new_totals():
+    totals = {"requests": 0, "errors": 0, "wall_s": 0.0}
+    totals.update({key: 0 for key in OLLAMA_COUNTS + OLLAMA_DURATIONS})
+    return totals
+
+def _add(totals, other):
+    for key, value in other.items():
+        totals[key] = totals.get(key, 0) + value
+
+def _open_trace(path, append):
+    if append and os.path.exists(path):
+        # Reopen the list that close() ended: drop the closing bracket and continue after a comma.
+        with open(path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 3))
+            if f.read() == b"\n]\n":
+                f.truncate(size - 3)
+                f.seek(size - 3)
+                f.write(b",\n")
+        return open(path, 'a', encoding='utf-8')
+    trace = open(path, 'w', encoding='utf-8')
+    trace.write("[\n")
+    return trace
+
+class RunMetrics:
+    """
+    Collects per-request timings and token counts, per-file totals and run
+    counters such as cache hits and retries. Safe to use from many threads.
+
+    With a `trace_path`, every request and file is also appended to an
+    event log in Chrome trace format (one JSON event per line), which can
+    be opened in chrome://tracing or Perfetto, or read line by line. With
+    `append`, events are added to an existing trace instead of replacing it.
+    """
+    def __init__(self, trace_path=None, append=False):
+        self.started = time.time()
+        self.finished = None
+        # Set by load() when resuming: when the first run started and how long earlier runs took.
+        self.first_started = None
+        self.previous_wall_s = 0.0
+        self.counters = {}
+        self.totals = _new_totals()
+        self.files = {}
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        self._clock = time.perf_counter()
+        self._trace = None
+        self.trace_path = trace_path
+        if trace_path:
+            self._trace = _open_trace(trace_path, append)
+
+    def load(self, execution_dir):
+        """
+        Adds the totals of an earlier metrics.json in `execution_dir`, so the
+        report of a resumed run covers the whole analysis, not only its last part.
+        """
+        path = os.path.join(execution_dir, METRICS_FILENAME)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        with self._lock:
+            self.first_started = report.get("started")
+            self.previous_wall_s += report["summary"]["wall_s"]
+            _add(self.counters, report["summary"]["counters"])
+            for url, totals in report["endpoints"].items():
+                # Every request is counted once per endpoint, so the endpoints add up to the run totals.
+                _add(self.totals, totals)
+                _add(self.endpoints.setdefault(url, _new_totals()), totals)
+            for tag, totals in report["files"].items():
+                _add(self.files.setdefault(tag, self._new_file()), totals)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_request(self, tag, endpoint, started, wall_s, response=None, error=None):
+        """
+        Records one HTTP request to Ollama. `started` is a time.perf_counter()
+        value, `response` the decoded JSON answer (None if the request failed).
+        """
+        response = response or {}
+        with self._lock:
+            targets = [self.totals, self.files.setdefault(tag, self._new_file()), self.endpoints.setdefault(endpoint, _new_totals())]
+            for totals in targets:
+                totals["requests"] += 1
+                totals["wall_s"] += wall_s
+                if error is not None:
+                    totals["errors"] += 1
+                for key in OLLAMA_COUNTS + OLLAMA_DURATIONS:
+                    value = response.get(key)
+                    if isinstance(value, (int, float)):
+                        totals[key] += value
+
+        if self._trace is not None:
+            args = {key: response[key] for key in OLLAMA_COUNTS + OLLAMA_DURATIONS if key in response}
+            args["endpoint"] = endpoint
+            if error is not None:
+                args["error"] = str(error)
+            self._event(os.path.basename(tag) if tag else "request", "request", started, wall_s, args)
+
+    def record_file(self, tag, started, wall_s, lines, commented):
+        with self._lock:
+            totals = self.files.setdefault(tag, self._new_file())
+            totals["file_wall_s"] += wall_s
+            totals["lines"] += lines
+            totals["commented_lines"] += commented
+        if self._trace is not None:
+            self._event(os.path.basename(tag), "file", started, wall_s, {"path": tag, "lines": lines})
+
+    def _new_file(self):
+        totals = _new_totals()
+        totals.update({"file_wall_s": 0.0, "lines": 0, "commented_lines": 0})
+        return totals
+
+    def _event(self, name, category, started, wall_s, args):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((started - self._clock) * 1e6),
+            "dur": round(wall_s * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        line = json.dumps(event) + ",\n"
+        with self._lock:
+            if self._trace is not None:
+                self._trace.write(line)
+
+    def summary(self):
+        """Returns the run totals, with Ollama's durations converted to seconds."""
+        finished = self.finished or time.time()
+        with self._lock:
+            totals = dict(self.totals)
+            counters = dict(self.counters)
+        wall_s = self.previous_wall_s + finished - self.started
+        ollama_s = totals["total_duration"] / 1e9
+        return {
+            "wall_s": round(wall_s, 3),
+            "requests": totals["requests"],
+            "request_errors": totals["errors"],
+            "lines_commented": counters.get("lines_commented", 0),
+            "prompt_tokens": totals["prompt_eval_count"],
+            "completion_tokens": totals["eval_count"],
+            "request_wall_s": round(totals["wall_s"], 3),
+            "load_s": round(totals["load_duration"] / 1e9, 3),
+            "prefill_s": round(totals["prompt_eval_duration"] / 1e9, 3),
+            "decode_s": round(totals["eval_duration"] / 1e9, 3),
+            # Time spent waiting on requests that Ollama did not account for: network, queueing, HTTP.
+            "network_s": round(max(0.0, totals["wall_s"] - ollama_s), 3),
+            "counters": counters,
+        }
+
+    def close(self):
+        if self.finished is None:
+            self.finished = time.time()
+        with self._lock:
+            if self._trace is not None:
+                # Chrome accepts a trailing comma; the closing event keeps the file valid JSON too.
+                self._trace.write(json.dumps({"name": "run", "ph": "i", "ts": round((time.perf_counter() - self._clock) * 1e6), "pid": os.getpid(), "s": "g"}) + "\n]\n")
+                self._trace.close()
+                self._trace = None
+
+    def write(self, execution_dir):
+        """Writes metrics.json into the execution directory and returns its path."""
+        self.close()
+        with self._lock:
+            report = {
+                "started": self.first_started or self.started,
+                "finished": self.finished,
+                "files": {path: dict(totals) for path, totals in self.files.items()},
+                "endpoints": {url: dict(totals) for url, totals in self.endpoints.items()},
+            }
+        report["summary"] = self.summary()
+        path = os.path.join(execution_dir, METRICS_FILENAME)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        return path
+
+    def print_summary(self, file=None):
+        summary = self.summary()
+        counters = summary["counters"]
+        lines_per_s = summary["lines_commented"] / summary["wall_s"] if summary["wall_s"] else 0.0
+        print("Run summary:", file=file)
+        print(f"  Lines commented: {summary['lines_commented']} in {summary['wall_s']:.1f}s ({lines_per_s:.1f} lines/s)", file=file)
+        print(f"  Requests: {summary['requests']} ({summary['request_errors']} failed, {counters.get('retries', 0)} retries)", file=file)
+        print(f"  Tokens: {summary['prompt_tokens']} prompt, {summary['completion_tokens']} generated", file=file)
+        print(
+            f"  Request time: {summary['request_wall_s']:.1f}s = load {summary['load_s']:.1f}s"
+            f" + prefill {summary['prefill_s']:.1f}s + decode {summary['decode_s']:.1f}s"
+            f" + network/other {summary['network_s']:.1f}s",
+            file=file
+        )
+        print(f"  Cache: {counters.get('cache_hits', 0)} hits, {counters.get('cache_misses', 0)} misses", file=file)
+        triaged = counters.get("triage_skipped", 0) + counters.get("triage_rule_comments", 0)
+        print(
+            f"  Calls saved: {triaged} by triage ({counters.get('triage_rule_comments', 0)} rule-based comments),"
+            f" {counters.get('deduplicated', 0)} by deduplication, {counters.get('cache_hits', 0)} by the cache",
+            file=file
+        )
+        if counters.get("failed_lines"):
+            print(f"  Lines left uncommented after errors: {counters['failed_lines']}", file=file)
@@ -0,0 +1,421 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+import requests
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote
+from . import core
+from . import ingest
+from . import checkpoint
+from . import main as cli
+from . import metrics as run_metrics
+from . import config as app_config
+
+DEFAULT_DAEMON_URL = "http://127.0.0.1:8765"
+# How often the daemon asks Ollama to keep the model loaded, in seconds.
+DEFAULT_WARM_INTERVAL = 240
+
+# Finished jobs are forgotten after this many seconds, or sooner once there
+# are more than MAX_FINISHED_JOBS of them; their output stays on disk.
+JOB_RETENTION = 24 * 3600
+MAX_FINISHED_JOBS = 1000
+
+# Per-job options; everything else is fixed when the daemon starts.
+JOB_OPTIONS = ("include", "exclude", "no_default_excludes", "max_file_size")
+# Options of `thutorpy serve` itself, not of the analysis.
+SERVE_OPTIONS = ("host", "port", "jobs", "warm_interval")
+
+def daemon_url(config):
+    return config.get("THUTORPY_DAEMON_URL", DEFAULT_DAEMON_URL).rstrip('/')
+
+class Job:
+    def __init__(self, path, priority=0, options=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.path = path
+        self.priority = priority
+        self.options = options or {}
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.execution_dir = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "path": self.path,
+            "priority": self.priority,
+            "options": self.options,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "execution_dir": self.execution_dir,
+            "error": self.error,
+        }
+
+class Daemon:
+    """
+    Runs file and repository jobs from a priority queue on one shared
+    AnalysisEngine, so every job reuses the same connection pool, comment
+    cache and in-flight request deduplication. Higher priorities run first;
+    jobs with the same priority run in submission order. A background
+    thread keeps the model loaded between jobs.
+    """
+    def __init__(self, config, engine, options, concurrent_jobs=1, warm_interval=DEFAULT_WARM_INTERVAL):
+        self.config = config
+        self.engine = engine
+        # The `thutorpy serve` options; a job's own JOB_OPTIONS override them.
+        self.options = options
+        self.concurrent_jobs = max(1, concurrent_jobs)
+        self.warm_interval = warm_interval
+        self.jobs = {}
+        self.queue = queue.PriorityQueue()
+        self.started = time.time()
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for index in range(self.concurrent_jobs):
+            thread = threading.Thread(target=self._run_jobs, name=f"thutorpy-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.warm_interval > 0:
+            thread = threading.Thread(target=self._keep_warm, name="thutorpy-warm", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+
+    def submit(self, path, priority=0, options=None):
+        """Queues a job. Raises ValueError if an option has the wrong type."""
+        options = {key: value for key, value in (options or {}).items() if key in JOB_OPTIONS}
+        for key in ("include", "exclude"):
+            if key in options and not (isinstance(options[key], list) and all(isinstance(glob, str) for glob in options[key])):
+                raise ValueError(f"'{key}' must be a list of globs.")
+        if "max_file_size" in options and not isinstance(options["max_file_size"], int):
+            raise ValueError("'max_file_size' must be a number of kilobytes.")
+        if "no_default_excludes" in options and not isinstance(options["no_default_excludes"], bool):
+            raise ValueError("'no_default_excludes' must be true or false.")
+        job = Job(path, priority, options)
+        with self._lock:
+            self._forget_finished_jobs()
+            self.jobs[job.id] = job
+            self._sequence += 1
+            self.queue.put((-job.priority, self._sequence, job.id))
+        return job
+
+    def cancel(self, job_id):
+        """Cancels a queued job. Returns the job, or None if it is unknown, running or finished."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return None
+            job.status = "cancelled"
+            job.finished = time.time()
+            return job
+
+    def _forget_finished_jobs(self):
+        """Drops finished jobs past JOB_RETENTION, then the oldest beyond MAX_FINISHED_JOBS. Needs the lock."""
+        finished = sorted(
+            (job for job in self.jobs.values() if job.finished is not None),
+            key=lambda job: job.finished
+        )
+        expired = time.time() - JOB_RETENTION
+        for index, job in enumerate(finished):
+            if job.finished < expired or len(finished) - index > MAX_FINISHED_JOBS:
+                del self.jobs[job.id]
+
+    def status(self):
+        with self._lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started, 1),
+            "model": self.config["OLLAMA_MODEL"],
+            "workers": self.engine.workers,
+            "jobs": counts,
+        }
+
+    def _run_jobs(self):
+        while not self._stopping.is_set():
+            try:
+                _, _, job_id = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is None or job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started = time.time()
+            try:
+                unfinished = self._run(job)
+                if unfinished:
+                    job.status = "incomplete"
+                    job.error = f"{len(unfinished)} file(s) are incomplete; run: thutorpy --resume {job.execution_dir}"
+                else:
+                    job.status = "done"
+            except SystemExit:
+                # The command-line helpers exit on fatal errors after printing them.
+                job.status = "failed"
+                job.error = job.error or "The analysis stopped with an error; see the daemon log."
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished = time.time()
+                # The cache lives as long as the daemon; keep it within its size limit between jobs.
+                if self.engine.cache is not None:
+                    self.engine.cache.prune()
+
+    def _run(self, job):
+        """Runs a job and returns its unfinished files, as listed by its manifest."""
+        config = dict(self.config)
+        options = {key: value for key, value in vars(self.options).items() if key not in SERVE_OPTIONS}
+        options.update(job.options)
+        cli.apply_options(config, argparse.Namespace(**options))
+
+        if not (os.path.isfile(job.path) or ingest.is_repository(job.path)):
+            job.error = f"The path '{job.path}' is not a valid file, directory or repository URL."
+            raise SystemExit(1)
+
+        execution_dir = cli.new_execution_dir(config["THUTORPY_OUTPUT_DIR"], job.path)
+        os.makedirs(execution_dir, exist_ok=True)
+        job.execution_dir = os.path.abspath(execution_dir)
+        # Saved in full so `thutorpy --resume` runs the job with the same options.
+        manifest = checkpoint.RunManifest(execution_dir, job.path, options)
+        manifest.save()
+        print(f"[job {job.id}] Analyzing {job.path} into {job.execution_dir}")
+        cli.run_analysis(job.path, execution_dir, config, self.engine, manifest)
+        manifest.finish()
+        unfinished = manifest.unfinished_files()
+        if unfinished:
+            print(f"[job {job.id}] Done, but {len(unfinished)} file(s) are incomplete")
+        else:
+            print(f"[job {job.id}] Done")
+        return unfinished
+
+    def _keep_warm(self):
+        while not self._stopping.is_set():
+            self.engine.client.warm(self.config["OLLAMA_MODEL"])
+            self._stopping.wait(self.warm_interval)
+
+    def result(self, job):
+        """Lists the output files of a job and their progress, from its manifest."""
+        result = job.to_dict()
+        result["files"] = {}
+        if job.execution_dir and os.path.exists(os.path.join(job.execution_dir, checkpoint.MANIFEST_FILENAME)):
+            manifest = checkpoint.RunManifest.load(job.execution_dir)
+            result["files"] = {
+                key: {
+                    "status": state["status"],
+                    "lines_done": state["lines_done"],
+                    "total_lines": state["total_lines"],
+                    "failed_lines": state.get("failed_lines", []),
+                }
+                for key, state in manifest.data["files"].items()
+            }
+        return result
+
+def make_handler(daemon):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            parts = self._parts()
+            if parts == ["health"]:
+                return self._send(200, daemon.status())
+            if parts == ["metrics"]:
+                return self._send(200, daemon.engine.metrics.summary())
+            if parts == ["jobs"]:
+                with daemon._lock:
+                    jobs = [job.to_dict() for job in daemon.jobs.values()]
+                return self._send(200, {"jobs": jobs})
+            if len(parts) >= 2 and parts[0] == "jobs":
+                job = daemon.jobs.get(parts[1])
+                if job is None:
+                    return self._send(404, {"error": f"No job with id '{parts[1]}'."})
+                if len(parts) == 2:
+                    return self._send(200, job.to_dict())
+                if parts[2:] == ["result"]:
+                    return self._send(200, daemon.result(job))
+                if parts[2] == "files" and len(parts) > 3 and job.execution_dir:
+                    return self._send_file(job, "/".join(parts[3:]))
+            self._send(404, {"error": "Not found."})
+
+        def do_POST(self):
+            if self._parts() != ["jobs"]:
+                return self._send(404, {"error": "Not found."})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                path = body["path"]
+                priority = int(body.get("priority", 0))
+            except (ValueError, KeyError, TypeError):
+                return self._send(400, {"error": "Expected a JSON body with a 'path' and an optional 'priority'."})
+            try:
+                job = daemon.submit(path, priority, body.get("options"))
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+            self._send(202, job.to_dict())
+
+        def do_DELETE(self):
+            parts = self._parts()
+            if len(parts) == 2 and parts[0] == "jobs":
+                job = daemon.cancel(parts[1])
+                if job is not None:
+                    return self._send(200, job.to_dict())
+                return self._send(409, {"error": "Only queued jobs can be cancelled."})
+            self._send(404, {"error": "Not found."})
+
+        def _parts(self):
+            return [unquote(part) for part in self.path.split('?', 1)[0].split('/') if part]
+
+        def _send_file(self, job, relative_path):
+            root = os.path.realpath(job.execution_dir)
+            path = os.path.realpath(os.path.join(root, relative_path))
+            if not path.startswith(root + os.sep) or not os.path.isfile(path):
+                return self._send(404, {"error": f"No output file '{relative_path}'."})
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send(self, status, payload):
+            data = json.dumps(payload, indent=4).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+def serve_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="thutorpy serve",
+        description="Run a ThutorPy daemon that analyzes submitted files and repositories from a job queue."
+    )
+    parser.add_argument("--host", default=None, help="Address to listen on (default: from THUTORPY_DAEMON_URL, 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=None, help="Port to listen on (default: from THUTORPY_DAEMON_URL, 8765).")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N", help="Number of jobs to run at the same time (default: 1).")
+    parser.add_argument(
+        "--warm-interval",
+        type=float,
+        default=DEFAULT_WARM_INTERVAL,
+        metavar="SECONDS",
+        help="How often to ask Ollama to keep the model loaded; 0 disables it (default: 240)."
+    )
+    cli.add_engine_arguments(parser)
+    # Default file selection for every job; jobs can override it.
+    cli.add_selection_arguments(parser)
+    args = parser.parse_args(argv)
+
+    config = app_config.load_config()
+    workers, batch_lines = cli.apply_options(config, args)
+    url = requests.utils.urlparse(daemon_url(config))
+    host = args.host or url.hostname or "127.0.0.1"
+    port = args.port or url.port or 8765
+
+    metrics = run_metrics.RunMetrics()
+    engine = core.AnalysisEngine(
+        config,
+        workers,
+        batch_lines,
+        use_cache=not args.no_cache,
+        context_tokens=args.context_tokens,
+        metrics=metrics,
+        triage_mode=args.triage,
+        dedup=not args.no_dedup
+    )
+    daemon = Daemon(config, engine, args, args.jobs, args.warm_interval)
+    httpd = ThreadingHTTPServer((host, port), make_handler(daemon))
+    httpd.daemon_threads = True
+    daemon.start()
+    print(f"ThutorPy daemon listening on http://{host}:{port} (model: {config['OLLAMA_MODEL']}, workers: {workers})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping daemon...")
+    finally:
+        daemon.stop()
+        httpd.server_close()
+        # Running jobs are checkpointed; `thutorpy --resume` can finish them.
+        engine.close(cancel=True)
+        if engine.cache is not None:
+            engine.cache.close()
+        sys.stdout.flush()
+        # Requests already in flight would otherwise hold up the exit until they return.
+        os._exit(0)
+
+def submit_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="thutorpy submit",
+        description="Hand a file or repository to a running ThutorPy daemon, "
+                    "or analyze it locally if no daemon is running."
+    )
+    parser.add_argument("path", help="The local file, directory, bare repository or git repository URL to analyze.")
+    parser.add_argument("--priority", type=int, default=0, help="Jobs with a higher priority run first (default: 0).")
+    parser.add_argument("--wait", action="store_true", help="Wait for the job to finish and print where its output is.")
+    cli.add_selection_arguments(parser)
+    args = parser.parse_args(argv)
+
+    config = app_config.load_config()
+    base_url = daemon_url(config)
+    path = args.path if ingest.is_remote(args.path) else os.path.abspath(args.path)
+    options = {key: getattr(args, key) for key in JOB_OPTIONS if getattr(args, key) not in (None, False)}
+
+    try:
+        requests.get(f"{base_url}/health", timeout=2).raise_for_status()
+    except requests.exceptions.RequestException:
+        print(f"No ThutorPy daemon is running at {base_url}; analyzing locally.", file=sys.stderr)
+        local_argv = [path]
+        for key, value in options.items():
+            flag = "--" + key.replace('_', '-')
+            if value is True:
+                local_argv.append(flag)
+            elif isinstance(value, list):
+                for item in value:
+                    local_argv += [flag, item]
+            else:
+                local_argv += [flag, str(value)]
+        cli.main(local_argv)
+        return
+
+    response = requests.post(
+        f"{base_url}/jobs",
+        json={"path": path, "priority": args.priority, "options": options},
+        timeout=10
+    )
+    response.raise_for_status()
+    job = response.json()
+    print(f"Submitted job {job['id']} for {path} to {base_url}.")
+    if not args.wait:
+        print(f"Check its status with: curl {base_url}/jobs/{job['id']}")
+        return
+
+    while job["status"] in ("queued", "running"):
+        time.sleep(1)
+        job = requests.get(f"{base_url}/jobs/{job['id']}", timeout=10).json()
+    if job["status"] != "done":
+        print(f"Job {job['id']} {job['status']}: {job.get('error') or 'see the daemon log.'}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Job {job['id']} done. Commented files are saved in: {job['execution_dir']}")
@@ -0,0 +1,107 @@
+import os
+import re
+
+# What to do with trivial lines: "rules" adds a canned comment where one
+# exists, "skip" leaves them uncommented, "off" sends them to the model.
+TRIAGE_MODES = ("rules", "skip", "off")
+DEFAULT_TRIAGE_MODE = "rules"
+
+SKIP = "skip"
+RULE = "rule"
+LLM = "llm"
+
+RULE_COMMENTS = {
+    "pass": "Does nothing; placeholder for an empty block.",
+    "...": "Does nothing; placeholder for an empty block.",
+    "return": "Returns from the function without a value.",
+    "return;": "Returns from the function without a value.",
+    "break": "Exits the enclosing loop.",
+    "break;": "Exits the enclosing loop.",
+    "continue": "Skips to the next iteration of the enclosing loop.",
+    "continue;": "Skips to the next iteration of the enclosing loop.",
+    "else:": "Runs when none of the preceding conditions were true.",
+    "else {": "Runs when none of the preceding conditions were true.",
+    "} else {": "Runs when none of the preceding conditions were true.",
+    "try:": "Starts a block whose errors are handled below.",
+    "try {": "Starts a block whose errors are handled below.",
+    "finally:": "Runs cleanup code whether or not an error occurred.",
+    "} finally {": "Runs cleanup code whether or not an error occurred.",
+    "except:": "Handles any error raised in the try block.",
+    "default:": "Handles every case not matched above.",
+    "fi": "Ends the if block.",
+    "done": "Ends the loop.",
+    "esac": "Ends the case block.",
+}
+
+# Lines made only of closing brackets and separators, like `}`, `});` or `]`.
+CLOSING_ONLY = re.compile(r"^[\s}\])]*[;,]?\s*$")
+END_KEYWORD = re.compile(r"^end[;.]?$")
+
+# Markers that start a comment line, by language family. A marker that is
+# code in another language (`#include`, `--i;`, `*p = 0;`) is only trusted
+# for the file names and extensions listed with it.
+HASH = r"#"
+C_LIKE = r"//|/\*|\*/"
+MARKUP = r"<!--|-->"
+COMMENT_MARKERS = [
+    (HASH + r"|\"\"\"|'''", (".py", ".pyw", ".pyi")),
+    (HASH, (
+        ".sh", ".bash", ".zsh", ".rb", ".pl", ".pm", ".r", ".yaml", ".yml", ".toml", ".cfg",
+        ".conf", ".ps1", ".jl", ".tf", ".cmake", ".nim", ".ex", ".exs", ".coffee",
+        "makefile", "dockerfile", "cmakelists.txt",
+    )),
+    (C_LIKE, (
+        ".c", ".h", ".cc", ".cpp", ".cxx", ".hpp", ".hh", ".m", ".mm", ".java", ".js", ".jsx",
+        ".mjs", ".cjs", ".ts", ".tsx", ".go", ".rs", ".cs", ".swift", ".kt", ".kts", ".scala",
+        ".dart", ".groovy", ".css", ".scss", ".less",
+    )),
+    (C_LIKE + "|" + HASH, (".php",)),
+    (C_LIKE + "|" + MARKUP, (".html", ".htm", ".vue", ".svelte")),
+    (MARKUP, (".xml", ".svg", ".md")),
+    (r"--", (".sql", ".lua", ".hs", ".elm", ".ada", ".adb", ".ads")),
+    (r"%", (".tex", ".erl", ".hrl")),
+    (r";", (".lisp", ".el", ".clj", ".cljs", ".scm", ".asm", ".s", ".ini")),
+]
+# Any other file: only markers that are rarely code, i.e. `#` followed by a space or `!`, `//`, `/*`, `*/` and HTML comments.
+GENERIC_COMMENT = re.compile(r"^(#(?=[\s!]|$)|" + C_LIKE + "|" + MARKUP + ")")
+
+_COMMENT_PATTERNS = {}
+for markers, names in COMMENT_MARKERS:
+    pattern = re.compile(r"^(" + markers + ")")
+    for name in names:
+        _COMMENT_PATTERNS[name] = pattern
+
+# Imports and includes whose meaning does not depend on the code around them.
+CONTEXT_FREE = re.compile(
+    r"^(import\s+[\w.]+(\s+as\s+\w+)?"
+    r"|from\s+[\w.]+\s+import\s+[\w., ]+"
+    r"|#include\s*[<\"][\w./]+[>\"]"
+    r"|using\s+namespace\s+[\w:]+;"
+    r"|import\s+[\w{}, *]+\s+from\s+['\"][\w@./-]+['\"];?"
+    r"|(const|let|var)\s+\w+\s*=\s*require\(\s*['\"][\w@./-]+['\"]\s*\);?)$"
+)
+
+def comment_pattern(file_path):
+    """Returns the regex matching comment-only lines in the language of `file_path`."""
+    if not file_path:
+        return GENERIC_COMMENT
+    name = os.path.basename(file_path).lower()
+    return _COMMENT_PATTERNS.get(name) or _COMMENT_PATTERNS.get(os.path.splitext(name)[1], GENERIC_COMMENT)
+
+def classify(code_line, mode=DEFAULT_TRIAGE_MODE, comments=GENERIC_COMMENT):
+    """
+    Decides how a stripped line should be commented. Returns (SKIP, None),
+    (RULE, comment) or (LLM, None). `comments` is the file's comment_pattern().
+    """
+    if mode == "off":
+        return LLM, None
+    if comments.match(code_line) or CLOSING_ONLY.match(code_line) or END_KEYWORD.match(code_line):
+        return SKIP, None
+    comment = RULE_COMMENTS.get(code_line)
+    if comment is not None:
+        return (RULE, comment) if mode == "rules" else (SKIP, None)
+    return LLM, None
+
+def is_context_free(code_line):
+    """True for lines such as `import os` that can be explained without context."""
+    return bool(CONTEXT_FREE.match(code_line))
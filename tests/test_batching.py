@@ -0,0 +1,81 @@
+"""
+Batched prompting: lines missing from a batch answer, or a batch answered
+with invalid JSON, fall back to single-line requests.
+"""
+import os
+import re
+import sys
+import json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from thutorpy import core
+from thutorpy.client import OllamaError
+
+CODE = "\n".join(f"value_{number} = compute({number})" for number in range(1, 13)) + "\n"
+
+class StubClient:
+    """Answers like Ollama, but `batch_answer` decides what each batch request returns."""
+    def __init__(self, batch_answer):
+        self.batch_answer = batch_answer
+        self.batch_requests = 0
+        self.line_requests = 0
+        self.metrics = None
+
+    def model_signature(self, default_model):
+        return default_model
+
+    def generate(self, payload, tag=None):
+        if payload.get("format") == "json":
+            self.batch_requests += 1
+            listing = payload["prompt"].split("Lines to comment (line number: code):", 1)[1]
+            numbers = [int(number) for number in re.findall(r"^(\d+): ", listing, re.MULTILINE)]
+            return {"response": self.batch_answer(numbers)}
+        self.line_requests += 1
+        line = re.search(r'The line to comment on is: "(.*)"', payload["prompt"]).group(1)
+        return {"response": f"Single comment for {line}."}
+
+    def close(self):
+        pass
+
+def make_engine(client, batch_lines=4):
+    config = {"OLLAMA_API_URL": "http://127.0.0.1:9/api/generate", "OLLAMA_MODEL": "m"}
+    engine = core.AnalysisEngine(config, workers=2, batch_lines=batch_lines, use_cache=False)
+    engine.client = client
+    return config, engine
+
+def test_lines_missing_from_a_batch_are_requested_alone():
+    # Every batch forgets its even line numbers.
+    client = StubClient(lambda numbers: json.dumps({str(n): f"Batch comment {n}." for n in numbers if n % 2}))
+    config, engine = make_engine(client)
+    with engine:
+        comments = core.comment_lines(CODE.splitlines(), CODE, config, engine, "values.py")
+
+    assert sorted(comments) == list(range(1, 13))
+    assert all(comments[n] == f"Batch comment {n}." for n in range(1, 13, 2))
+    assert all(comments[n].startswith("Single comment for value_") for n in range(2, 13, 2))
+    assert client.batch_requests == 3
+    assert client.line_requests == 6
+    assert engine.metrics.counters["batch_fallback_lines"] == 6
+
+def test_invalid_json_falls_back_to_single_lines():
+    client = StubClient(lambda numbers: "this is not JSON")
+    config, engine = make_engine(client)
+    with engine:
+        comments = core.comment_lines(CODE.splitlines(), CODE, config, engine, "values.py")
+
+    assert sorted(comments) == list(range(1, 13))
+    assert client.line_requests == 12
+    assert engine.metrics.counters["batch_fallback_lines"] == 12
+
+def test_failed_batch_request_falls_back_to_single_lines():
+    def fail(numbers):
+        raise OllamaError("simulated failure")
+    client = StubClient(fail)
+    config, engine = make_engine(client)
+    with engine:
+        comments = core.comment_lines(CODE.splitlines(), CODE, config, engine, "values.py")
+
+    assert sorted(comments) == list(range(1, 13))
+    assert engine.metrics.counters["batch_fallback_lines"] == 12
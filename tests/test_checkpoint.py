@@ -0,0 +1,172 @@
+"""
+Checkpointing and resume: the manifest rules and segmented output, against
+a FakeOllamaServer.
+"""
+import os
+import sys
+import json
+import hashlib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_ollama import FakeOllamaServer
+from thutorpy import core
+from thutorpy import main as cli
+from thutorpy.checkpoint import RunManifest
+
+SOURCE = "".join(f"total_{number} = total_{number - 1} + {number}\n" for number in range(1, 41))
+
+def make_config(server):
+    return {"OLLAMA_API_URL": server.url, "OLLAMA_MODEL": "m", "OLLAMA_MAX_RETRIES": 0}
+
+def write_source(tmp_path, code=SOURCE):
+    path = tmp_path / "totals.py"
+    path.write_text(code)
+    return str(path)
+
+class InterruptingManifest(RunManifest):
+    """Stops the run, like Ctrl-C, right after `segments` segments are checkpointed."""
+    def __init__(self, execution_dir, source, options, segments):
+        super().__init__(execution_dir, source, options)
+        self.segments = segments
+
+    def record_progress(self, output_path, lines_done, bytes_done):
+        super().record_progress(output_path, lines_done, bytes_done)
+        self.segments -= 1
+        if self.segments == 0:
+            raise KeyboardInterrupt
+
+def analyze(config, file_path, output_path, manifest, segment_lines=8):
+    with core.AnalysisEngine(config, use_cache=False) as engine:
+        engine.segment_lines = segment_lines
+        core.analyze_code(file_path, output_path, config, engine, manifest)
+
+def source_hash(code):
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+def test_interrupted_run_resumes_to_identical_output(tmp_path):
+    file_path = write_source(tmp_path)
+    clean_dir = tmp_path / "clean"
+    resumed_dir = tmp_path / "resumed"
+    clean_dir.mkdir()
+    resumed_dir.mkdir()
+
+    with FakeOllamaServer() as server:
+        config = make_config(server)
+        analyze(config, file_path, str(clean_dir / "totals.py"), RunManifest(str(clean_dir), file_path, {}))
+        assert server.stats()["requests"] == 40
+
+        manifest = InterruptingManifest(str(resumed_dir), file_path, {}, segments=2)
+        with pytest.raises(KeyboardInterrupt):
+            analyze(config, file_path, str(resumed_dir / "totals.py"), manifest)
+        manifest.save()
+        state = manifest.data["files"]["totals.py"]
+        assert (state["status"], state["lines_done"]) == ("in_progress", 16)
+
+        # Part of a segment written after the last checkpoint is cut off on resume.
+        with open(resumed_dir / "totals.py", 'ab') as f:
+            f.write(b"total_17 = total_16 + 17  # half a segment")
+        analyze(config, file_path, str(resumed_dir / "totals.py"), RunManifest.load(str(resumed_dir)))
+        assert server.stats()["requests"] == 40 + 16 + 24
+
+    assert (resumed_dir / "totals.py").read_bytes() == (clean_dir / "totals.py").read_bytes()
+    assert RunManifest.load(str(resumed_dir)).data["files"]["totals.py"]["status"] == "done"
+
+def test_start_file_resumes_from_the_checkpoint(tmp_path):
+    output_path = tmp_path / "totals.py"
+    manifest = RunManifest(str(tmp_path), "totals.py", {})
+    assert manifest.start_file(str(output_path), source_hash(SOURCE), 40) == (0, 0)
+    output_path.write_bytes(b"x" * 120)
+    manifest.record_progress(str(output_path), 8, 100)
+    assert manifest.start_file(str(output_path), source_hash(SOURCE), 40) == (8, 100)
+
+def test_start_file_restarts_a_changed_source(tmp_path):
+    output_path = tmp_path / "totals.py"
+    manifest = RunManifest(str(tmp_path), "totals.py", {})
+    manifest.start_file(str(output_path), source_hash(SOURCE), 40)
+    output_path.write_bytes(b"x" * 120)
+    manifest.record_progress(str(output_path), 8, 100)
+    assert manifest.start_file(str(output_path), source_hash(SOURCE + "extra = 1\n"), 41) == (0, 0)
+    assert manifest.data["files"]["totals.py"]["lines_done"] == 0
+
+@pytest.mark.parametrize("output", [None, b"x" * 50])
+def test_start_file_restarts_without_its_partial_output(tmp_path, output):
+    output_path = tmp_path / "totals.py"
+    manifest = RunManifest(str(tmp_path), "totals.py", {})
+    manifest.start_file(str(output_path), source_hash(SOURCE), 40)
+    manifest.record_progress(str(output_path), 8, 100)
+    if output is not None:
+        output_path.write_bytes(output)
+    assert manifest.start_file(str(output_path), source_hash(SOURCE), 40) == (0, 0)
+
+def test_start_file_skips_done_files_only_while_their_output_exists(tmp_path):
+    output_path = tmp_path / "totals.py"
+    manifest = RunManifest(str(tmp_path), "totals.py", {})
+    manifest.start_file(str(output_path), source_hash(SOURCE), 40)
+    output_path.write_bytes(b"x" * 120)
+    manifest.record_progress(str(output_path), 40, 120)
+    manifest.finish_file(str(output_path))
+    assert manifest.start_file(str(output_path), source_hash(SOURCE), 40) is None
+    output_path.unlink()
+    assert manifest.start_file(str(output_path), source_hash(SOURCE), 40) == (0, 0)
+
+def test_start_file_restarts_incomplete_files(tmp_path):
+    output_path = tmp_path / "totals.py"
+    manifest = RunManifest(str(tmp_path), "totals.py", {})
+    manifest.start_file(str(output_path), source_hash(SOURCE), 40)
+    output_path.write_bytes(b"x" * 120)
+    manifest.record_progress(str(output_path), 40, 120)
+    manifest.finish_file(str(output_path), [3, 7])
+    assert manifest.start_file(str(output_path), source_hash(SOURCE), 40) == (0, 0)
+
+def test_merge_options_overrides_saved_options():
+    saved = {"workers": 2, "batch_lines": 4, "include": ["*.py"], "no_cache": True, "trace": True}
+    args = cli.build_parser().parse_args(["--resume", "run", "--workers", "8", "--exclude", "tests/"])
+    merged = cli.merge_options(saved, args)
+    assert merged.workers == 8
+    assert merged.exclude == ["tests/"]
+    # Options not given again, including flags left unset, keep their saved values.
+    assert merged.batch_lines == 4
+    assert merged.include == ["*.py"]
+    assert merged.no_cache is True
+    assert merged.trace is True
+    assert merged.resume is None
+    assert merged.path is None
+
+def test_merge_options_fills_in_defaults_missing_from_old_manifests():
+    args = cli.build_parser().parse_args(["--resume", "run"])
+    merged = cli.merge_options({"workers": 3}, args)
+    assert merged.workers == 3
+    assert merged.context_tokens is None
+    assert merged.no_dedup is False
+
+def test_failed_lines_leave_the_file_incomplete_until_resumed(tmp_path):
+    file_path = write_source(tmp_path)
+    output_path = str(tmp_path / "out" / "totals.py")
+    os.makedirs(os.path.dirname(output_path))
+    manifest = RunManifest(str(tmp_path / "out"), file_path, {})
+
+    with FakeOllamaServer(error_rate=1.0) as server:
+        config = make_config(server)
+        with core.AnalysisEngine(config, use_cache=False) as engine:
+            core.analyze_code(file_path, output_path, config, engine, manifest)
+        state = manifest.data["files"]["totals.py"]
+        assert state["status"] == "incomplete"
+        assert state["failed_lines"] == list(range(1, 41))
+        assert list(manifest.unfinished_files()) == ["totals.py"]
+
+        server.error_rate = 0.0
+        resumed = RunManifest.load(str(tmp_path / "out"))
+        with core.AnalysisEngine(config, use_cache=False) as engine:
+            core.analyze_code(file_path, output_path, config, engine, resumed)
+
+    assert resumed.unfinished_files() == {}
+    assert "failed_lines" not in resumed.data["files"]["totals.py"]
+    with open(output_path) as f:
+        assert all("  # " in line for line in f)
+    with open(os.path.join(tmp_path, "out", "manifest.json")) as f:
+        assert json.load(f)["files"]["totals.py"]["status"] == "done"
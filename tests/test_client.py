@@ -0,0 +1,118 @@
+"""
+Scheduler and failover tests for OllamaClient, run against local
+FakeOllamaServer instances standing in for several Ollama servers.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_ollama import FakeOllamaServer
+from thutorpy import client as ollama_client
+from thutorpy.client import Endpoint, OllamaClient, OllamaError, parse_endpoints
+
+def make_client(servers, weights=None, models=None, workers=4, max_retries=2):
+    weights = weights or [1] * len(servers)
+    models = models or [None] * len(servers)
+    endpoints = [Endpoint(server.url, weight, model) for server, weight, model in zip(servers, weights, models)]
+    return OllamaClient(endpoints, pool_size=workers, read_timeout=10, max_retries=max_retries, backoff_base=0.0)
+
+def run_requests(client, count, workers=4):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(client.generate, {"model": "m", "prompt": f"line {i}"}) for i in range(count)]
+        return [future.result() for future in futures]
+
+def test_parse_endpoints_falls_back_to_api_url():
+    endpoints = parse_endpoints({"OLLAMA_API_URL": "http://a/api/generate"})
+    assert [endpoint.url for endpoint in endpoints] == ["http://a/api/generate"]
+
+def test_parse_endpoints_reads_weights_and_models():
+    config = {
+        "OLLAMA_API_URL": "http://a/api/generate",
+        "OLLAMA_ENDPOINTS": ["http://a/api/generate", {"url": "http://b/api/generate", "weight": 3, "model": "big"}],
+    }
+    first, second = parse_endpoints(config)
+    assert (first.weight, first.model) == (1.0, None)
+    assert (second.weight, second.model) == (3.0, "big")
+
+def test_weighted_endpoint_gets_more_requests():
+    with FakeOllamaServer(latency=0.02) as light, FakeOllamaServer(latency=0.02) as heavy:
+        client = make_client([light, heavy], weights=[1, 4])
+        run_requests(client, 60)
+        client.close()
+        assert heavy.stats()["requests"] > 2 * light.stats()["requests"]
+
+def test_faster_endpoint_gets_more_requests():
+    with FakeOllamaServer(latency=0.15) as slow, FakeOllamaServer(latency=0.01) as fast:
+        client = make_client([slow, fast])
+        run_requests(client, 60)
+        client.close()
+        assert fast.stats()["requests"] > 3 * slow.stats()["requests"]
+
+def test_failing_endpoint_is_taken_out_of_rotation():
+    with FakeOllamaServer(error_rate=1.0) as broken, FakeOllamaServer(latency=0.01) as healthy:
+        client = make_client([broken, healthy])
+        results = run_requests(client, 40)
+        client.close()
+        assert len(results) == 40
+        assert all(result["response"] for result in results)
+        # Each request retries on the other server, and the broken one is benched after a few failures.
+        assert broken.stats()["requests"] <= ollama_client.UNHEALTHY_AFTER_FAILURES + 4
+        assert client.endpoints[0].unhealthy_until > time.monotonic()
+
+def test_endpoint_returns_to_rotation_after_recovering(monkeypatch):
+    monkeypatch.setattr(ollama_client, "UNHEALTHY_COOLDOWN", 0.1)
+    with FakeOllamaServer(error_rate=1.0) as flaky, FakeOllamaServer(latency=0.01) as healthy:
+        client = make_client([flaky, healthy], workers=1)
+        run_requests(client, 10, workers=1)
+        assert client.endpoints[0].consecutive_failures >= ollama_client.UNHEALTHY_AFTER_FAILURES
+
+        flaky.error_rate = 0.0
+        time.sleep(0.2)
+        run_requests(client, 10, workers=1)
+        client.close()
+        assert client.endpoints[0].consecutive_failures == 0
+        assert client.endpoints[0].unhealthy_until == 0.0
+
+def test_gives_up_when_every_endpoint_fails():
+    with FakeOllamaServer(error_rate=1.0) as first, FakeOllamaServer(error_rate=1.0) as second:
+        client = make_client([first, second], max_retries=2)
+        with pytest.raises(OllamaError):
+            client.generate({"model": "m", "prompt": "x = 1"})
+        client.close()
+        assert first.stats()["requests"] + second.stats()["requests"] == 3
+
+def test_endpoint_model_overrides_default():
+    with FakeOllamaServer() as server:
+        client = make_client([server], models=["small-model"])
+        result = client.generate({"model": "m", "prompt": "x = 1"})
+        client.close()
+        assert result["model"] == "small-model"
+        assert client.model_signature("m") == "small-model"
+
+def test_rejected_request_fails_over_without_benching_the_endpoint():
+    with FakeOllamaServer(models=["other"]) as lacking, FakeOllamaServer(latency=0.01) as serving:
+        client = make_client([lacking, serving])
+        results = run_requests(client, 20)
+        client.close()
+        assert len(results) == 20
+        assert lacking.stats()["requests"] > ollama_client.UNHEALTHY_AFTER_FAILURES
+        assert client.endpoints[0].consecutive_failures == 0
+        assert client.endpoints[0].unhealthy_until == 0.0
+
+def test_rejected_request_is_not_retried_on_the_same_endpoint():
+    with FakeOllamaServer(models=["other"]) as server:
+        client = make_client([server], max_retries=4)
+        with pytest.raises(OllamaError, match="not found"):
+            client.generate({"model": "m", "prompt": "x = 1"})
+        client.close()
+        assert server.stats()["requests"] == 1
+        assert client.endpoints[0].consecutive_failures == 0
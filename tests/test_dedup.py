@@ -0,0 +1,45 @@
+"""
+In-run deduplication: identical requests across files are sent once, with
+or without the comment cache.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_ollama import FakeOllamaServer
+from thutorpy import core
+
+SOURCE = "import os\nimport sys\n"
+
+def analyze_copies(server, tmp_path, count=5, **engine_options):
+    config = {"OLLAMA_API_URL": server.url, "OLLAMA_MODEL": "m", "OUTPUT_DIR": str(tmp_path)}
+    engine = core.AnalysisEngine(config, workers=1, **engine_options)
+    with engine:
+        for index in range(count):
+            path = tmp_path / f"module_{index}.py"
+            path.write_text(SOURCE)
+            core.analyze_code(str(path), str(tmp_path / f"module_{index}_commented.py"), config, engine)
+    return engine
+
+def test_dedup_across_files_without_cache(tmp_path):
+    with FakeOllamaServer() as server:
+        engine = analyze_copies(server, tmp_path, use_cache=False)
+        assert server.stats()["requests"] == 2
+    assert engine.metrics.counters["deduplicated"] == 8
+    assert engine.metrics.counters["lines_commented"] == 10
+
+def test_dedup_memory_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "DEDUP_MEMORY", 1)
+    with FakeOllamaServer() as server:
+        engine = analyze_copies(server, tmp_path, count=2, use_cache=False)
+        # Only the comment for `import sys` is remembered, so `import os` is requested again.
+        assert server.stats()["requests"] == 3
+    assert len(engine._finished) == 1
+
+def test_no_dedup_sends_every_request(tmp_path):
+    with FakeOllamaServer() as server:
+        analyze_copies(server, tmp_path, use_cache=False, dedup=False)
+        assert server.stats()["requests"] == 10
@@ -0,0 +1,134 @@
+"""
+Ingestion tests on a temporary git repository and a bare clone of it, so
+they run offline.
+"""
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from thutorpy import ingest
+
+SOURCE = "def greet(name):\n    return f'Hello, {name}!'\n"
+MINIFIED = "var a=" + ",".join(f"b{i}=function(){{return {i}}}" for i in range(80)) + ";\n"
+LARGE = "".join(f"line_{i} = {i}\n" for i in range(400))
+
+def git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+def write(root, path, content):
+    full_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    mode = 'wb' if isinstance(content, bytes) else 'w'
+    with open(full_path, mode) as f:
+        f.write(content)
+
+@pytest.fixture
+def work_tree(tmp_path):
+    root = str(tmp_path / "project")
+    os.makedirs(root)
+    git("init", "--quiet", cwd=root)
+    git("config", "user.email", "tests@example.com", cwd=root)
+    git("config", "user.name", "Tests", cwd=root)
+    write(root, ".gitignore", "*.log\nout/\n")
+    write(root, "src/app.py", SOURCE)
+    write(root, "src/big.py", LARGE)
+    write(root, "static/app.js", MINIFIED)
+    write(root, "assets/logo.png", b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR")
+    write(root, "node_modules/lib/index.js", "module.exports = 1;\n")
+    write(root, "empty.txt", "")
+    git("add", "-A", cwd=root)
+    git("commit", "--quiet", "-m", "Initial commit", cwd=root)
+    # Ignored and untracked files that only exist in the work tree.
+    write(root, "debug.log", "ignored\n")
+    write(root, "out/result.py", SOURCE)
+    write(root, "notes.py", SOURCE)
+    return root
+
+@pytest.fixture
+def bare_repository(work_tree, tmp_path):
+    path = str(tmp_path / "project.git")
+    git("clone", "--quiet", "--bare", work_tree, path, cwd=str(tmp_path))
+    return path
+
+def test_list_work_tree_respects_gitignore(work_tree):
+    paths = [path for path, _ in ingest.list_work_tree(work_tree)]
+    assert "debug.log" not in paths
+    assert "out/result.py" not in paths
+    assert "notes.py" in paths
+    assert "src/app.py" in paths
+
+def test_list_work_tree_without_git(tmp_path):
+    root = str(tmp_path / "plain")
+    write(root, "a.py", SOURCE)
+    write(root, "pkg/b.py", SOURCE)
+    write(root, ".git/config", "[core]\n")
+    assert ingest.list_work_tree(root) == [("a.py", len(SOURCE)), ("pkg/b.py", len(SOURCE))]
+
+def test_repository_kinds(work_tree, bare_repository):
+    assert ingest.is_work_tree(work_tree)
+    assert not ingest.is_bare_repository(work_tree)
+    assert ingest.is_bare_repository(bare_repository)
+    assert ingest.is_repository(bare_repository)
+    assert ingest.is_remote("https://github.com/owner/repo")
+    assert not ingest.is_remote(bare_repository)
+
+def test_sniff_detects_binary_and_minified_files(work_tree):
+    assert ingest.sniff(os.path.join(work_tree, "assets/logo.png")) == "binary"
+    assert ingest.sniff(os.path.join(work_tree, "static/app.js")) == "minified"
+    assert ingest.sniff(os.path.join(work_tree, "src/app.py")) is None
+
+def test_select_and_sniff_work_tree(work_tree):
+    entries = ingest.list_work_tree(work_tree)
+    paths, skipped = ingest.select_files(entries, max_file_size=4096)
+    paths = ingest.sniff_files(work_tree, paths, skipped)
+    assert paths == [".gitignore", "notes.py", "src/app.py"]
+    assert skipped == {"binary": 1, "empty": 1, "excluded": 1, "minified": 1, "too large": 1}
+
+def test_include_and_exclude(work_tree):
+    entries = ingest.list_work_tree(work_tree)
+    paths, skipped = ingest.select_files(entries, include=["*.py"], exclude=["src/"], max_file_size=0)
+    assert paths == ["notes.py"]
+    assert skipped["not included"] == 5
+    assert skipped["excluded"] == 2
+
+def test_clone_filters_out_large_blobs(bare_repository, tmp_path):
+    dest = str(tmp_path / "clone")
+    entries = dict(ingest.clone_repository(bare_repository, dest, max_file_size=4096))
+    # The large file is listed, but its blob was never fetched.
+    assert entries["src/big.py"] is None
+    assert entries["src/app.py"] == len(SOURCE)
+    assert "debug.log" not in entries
+
+    paths, skipped = ingest.select_files(list(entries.items()), max_file_size=4096)
+    assert skipped["too large"] == 1
+    ingest.checkout_files(dest, paths)
+    paths = ingest.sniff_files(dest, paths, skipped)
+    assert paths == [".gitignore", "src/app.py"]
+    assert not os.path.exists(os.path.join(dest, "src/big.py"))
+
+def test_clone_without_size_limit_keeps_every_blob(bare_repository, tmp_path):
+    entries = dict(ingest.clone_repository(bare_repository, str(tmp_path / "clone"), max_file_size=0))
+    assert entries["src/big.py"] == len(LARGE)
+
+@pytest.mark.parametrize("path, pattern, expected", [
+    ("src/app.py", "src/", True),
+    ("lib/src/app.py", "src/", True),
+    ("src.py", "src/", False),
+    ("a/b/c.py", "a/b/", True),
+    ("x/a/b/c.py", "a/b/", False),
+    ("src/app.py", "*.py", True),
+    ("src/app.pyc", "*.py", False),
+    ("deep/dir/app.py", "*.py", True),
+    ("a/bc.py", "a/b*", True),
+    ("a/bc/d.py", "a/b*", True),
+    ("a/x/bc.py", "a/b*", False),
+    ("x/a/bc.py", "a/b*", False),
+    ("a/bc.py", "/a/b*", True),
+])
+def test_matches(path, pattern, expected):
+    assert ingest.matches(path, pattern) == expected
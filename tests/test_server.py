@@ -0,0 +1,50 @@
+"""
+Daemon job bookkeeping: cancelling queued jobs and forgetting finished ones.
+"""
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from thutorpy import server
+
+def make_daemon():
+    # Jobs are only queued here, never run, so no engine is needed.
+    return server.Daemon({"OLLAMA_MODEL": "m"}, None, argparse.Namespace())
+
+def finish(job, status="done", age=0.0):
+    job.status = status
+    job.finished = time.time() - age
+
+def test_cancel_only_queued_jobs():
+    daemon = make_daemon()
+    queued = daemon.submit("a.py")
+    running = daemon.submit("b.py")
+    running.status = "running"
+    assert daemon.cancel(queued.id) is queued
+    assert queued.status == "cancelled"
+    assert daemon.cancel(running.id) is None
+    assert daemon.cancel("unknown") is None
+
+def test_finished_jobs_expire_after_the_retention_period():
+    daemon = make_daemon()
+    old = daemon.submit("old.py")
+    recent = daemon.submit("recent.py")
+    running = daemon.submit("running.py")
+    finish(old, age=server.JOB_RETENTION + 1)
+    finish(recent, status="failed")
+    running.status = "running"
+    latest = daemon.submit("latest.py")
+    assert set(daemon.jobs) == {recent.id, running.id, latest.id}
+
+def test_oldest_finished_jobs_are_dropped_beyond_the_limit(monkeypatch):
+    monkeypatch.setattr(server, "MAX_FINISHED_JOBS", 2)
+    daemon = make_daemon()
+    jobs = [daemon.submit(f"{index}.py") for index in range(4)]
+    for age, job in zip((40, 30, 20, 10), jobs):
+        finish(job, age=age)
+    queued = daemon.submit("queued.py")
+    assert set(daemon.jobs) == {jobs[2].id, jobs[3].id, queued.id}
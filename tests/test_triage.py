@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from thutorpy import triage
+
+@pytest.mark.parametrize("file_path, line", [
+    ("main.c", "#include <stdio.h>"),
+    ("main.c", "#define SIZE 16"),
+    ("main.c", "*p = 0;"),
+    ("main.c", "--i;"),
+    ("main.c", "* 2)"),
+    ("notes.txt", "%d items"),
+    ("notes.txt", "#include <stdio.h>"),
+])
+def test_code_is_not_mistaken_for_a_comment(file_path, line):
+    action, _ = triage.classify(line, "rules", triage.comment_pattern(file_path))
+    assert action == triage.LLM
+
+@pytest.mark.parametrize("file_path, line", [
+    ("main.c", "// Allocate the buffer."),
+    ("main.c", "/* Allocate the buffer. */"),
+    ("app.py", "#compact comment"),
+    ("app.py", '"""Docstring."""'),
+    ("query.sql", "-- Select active users."),
+    ("paper.tex", "% Section one"),
+    ("Makefile", "#all: build"),
+    ("notes.txt", "# A note"),
+    (None, "#!/bin/sh"),
+])
+def test_comment_lines_are_skipped(file_path, line):
+    action, _ = triage.classify(line, "rules", triage.comment_pattern(file_path))
+    assert action == triage.SKIP
+
+def test_include_is_context_free():
+    assert triage.is_context_free("#include <stdio.h>")
+
+def test_rule_comments_follow_mode():
+    assert triage.classify("pass", "rules") == (triage.RULE, triage.RULE_COMMENTS["pass"])
+    assert triage.classify("pass", "skip") == (triage.SKIP, None)
+    assert triage.classify("# comment", "off") == (triage.LLM, None)